@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the benchmark of the scanner. It starts stand-in listeners on the loopback interface, open
+ports that accept connections, refusing ports that have no listener, and blackholed ports whose accept queue
+is full so that connection attempts are silently dropped. The 'udp' engine gets UDP stand-ins instead: open
+ports that answer every datagram, closed ports that have no socket, and blackholed ports whose socket never
+answers. Then it scans them with every engine and thread limit asked for, each run in a fresh process, and
+reports the throughput, latency, peak memory and file descriptor usage of each run.
+
+Usage: python PortScanBenchmark.py --engines thread asyncio udp --thread-limits 100 1000 --closed 5000
+"""
+
+import argparse
+import json
+import os
+import platform
+import selectors
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, peak memory is not reported there.
+    resource = None
+
+import synscan
+import udpscan
+from PortScanner import PortScanner
+from results import PortStatus
+
+LOOPBACK = '127.0.0.1'
+
+
+class Listeners:
+    """
+    Stand-in listeners on the loopback interface. Connections to the open ports are accepted and closed right
+    away by a background thread, so that their accept queues never fill up. UDP stand-ins answer every
+    datagram sent to the open ports from the same thread.
+    """
+
+    def __init__(self, open_count, closed_count, blackholed_count, protocol='tcp'):
+        """
+        :param open_count: the number of open ports
+        :type open_count: int
+        :param closed_count: the number of refusing ports
+        :type closed_count: int
+        :param blackholed_count: the number of blackholed ports
+        :type blackholed_count: int
+        :param protocol: 'tcp' or 'udp'
+        :type protocol: str
+        """
+        self.__socks = []
+        self.__selector = selectors.DefaultSelector()
+        self.__stopped = threading.Event()
+        self.__kind = socket.SOCK_DGRAM if protocol == 'udp' else socket.SOCK_STREAM
+
+        if self.__kind == socket.SOCK_DGRAM:
+            self.open_ports = [self.__bind(answer=True) for _ in range(open_count)]
+            # A bound socket that is never read answers nothing, not even with an ICMP error.
+            self.blackholed_ports = [self.__bind() for _ in range(blackholed_count)]
+        else:
+            self.open_ports = [self.__listen(4096, accept=True) for _ in range(open_count)]
+            self.blackholed_ports = [self.__blackhole() for _ in range(blackholed_count)]
+        self.closed_ports = self.__free_ports(closed_count, set(self.open_ports) | set(self.blackholed_ports))
+
+        self.__thread = threading.Thread(target=self.__accept)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __listen(self, backlog, accept=False):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((LOOPBACK, 0))
+        sock.listen(backlog)
+        self.__socks.append(sock)
+        if accept:
+            sock.setblocking(False)
+            self.__selector.register(sock, selectors.EVENT_READ)
+        return sock.getsockname()[1]
+
+    def __bind(self, answer=False):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((LOOPBACK, 0))
+        self.__socks.append(sock)
+        if answer:
+            sock.setblocking(False)
+            self.__selector.register(sock, selectors.EVENT_READ)
+        return sock.getsockname()[1]
+
+    def __blackhole(self):
+        """
+        Open a listener and fill its accept queue, the kernel then drops the SYNs sent to it.
+        This relies on Linux behavior, on other systems the port may show up as CLOSED instead.
+        """
+        port = self.__listen(0)
+        for _ in range(4):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            sock.connect_ex((LOOPBACK, port))
+            self.__socks.append(sock)
+        time.sleep(0.05)
+        return port
+
+    def __free_ports(self, count, excluded):
+        """
+        :return: count ports of the loopback interface that no socket is listening on, or bound to for UDP.
+        :rtype: list
+        """
+        ports = []
+        port = 20000
+        while len(ports) < count and port <= 65535:
+            if port not in excluded:
+                probe = socket.socket(socket.AF_INET, self.__kind)
+                try:
+                    if self.__kind == socket.SOCK_DGRAM:
+                        probe.bind((LOOPBACK, port))
+                        ports.append(port)
+                    elif probe.connect_ex((LOOPBACK, port)) != 0:
+                        ports.append(port)
+                except OSError:
+                    pass
+                finally:
+                    probe.close()
+            port += 1
+        return ports
+
+    def __accept(self):
+        while not self.__stopped.is_set():
+            for key, events in self.__selector.select(timeout=0.1):
+                while True:
+                    try:
+                        if self.__kind == socket.SOCK_DGRAM:
+                            data, address = key.fileobj.recvfrom(65535)
+                            key.fileobj.sendto(data[:64], address)
+                        else:
+                            conn, address = key.fileobj.accept()
+                            conn.close()
+                    except (BlockingIOError, OSError):
+                        break
+
+    def expected(self):
+        """
+        :return: a dict in the form of {port: expected PortStatus}.
+        :rtype: dict
+        """
+        expected = {port: PortStatus.OPEN for port in self.open_ports}
+        expected.update((port, PortStatus.CLOSED) for port in self.closed_ports)
+        expected.update((port, PortStatus.FILTERED) for port in self.blackholed_ports)
+        return expected
+
+    def close(self):
+        self.__stopped.set()
+        self.__thread.join()
+        self.__selector.close()
+        for sock in self.__socks:
+            sock.close()
+
+
+def percentile(values, p):
+    """
+    :param values: the sorted values
+    :type values: list
+    :param p: the percentile, between 0 and 100
+    :type p: float
+    :return: the nearest rank percentile of the values, or None if there is none.
+    :rtype: float
+    """
+    if not values:
+        return None
+    rank = max(1, int(round(p / 100.0 * len(values) + 0.5)))
+    return values[min(rank, len(values)) - 1]
+
+
+def count_fds():
+    """
+    :return: the number of file descriptors open in this process, or None if it cannot be told.
+    :rtype: int
+    """
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def run(expected, engine, thread_limit, delay):
+    """
+    Scan the stand-in listeners once, in the calling process, and measure the run.
+
+    :param expected: a dict in the form of {port: expected PortStatus}
+    :type expected: dict
+    :param engine: the scanning engine
+    :type engine: str
+    :param thread_limit: the thread limit of the scanner
+    :type thread_limit: int
+    :param delay: the timeout delay of the scanner in seconds
+    :type delay: float
+    :return: the measurements of the run.
+    :rtype: dict
+    """
+    peak_fds = [count_fds() or 0]
+    stopped = threading.Event()
+
+    def sample():
+        while not stopped.wait(0.01):
+            peak_fds[0] = max(peak_fds[0], count_fds() or 0)
+
+    sampler = threading.Thread(target=sample)
+    sampler.daemon = True
+    sampler.start()
+
+    rtts = []
+    statuses = Counter()
+    mismatches = 0
+    scanner = PortScanner(sorted(expected))
+    scanner.set_engine(engine)
+    scanner.set_thread_limit(thread_limit)
+    scanner.set_delay(delay)
+
+    start_time = time.perf_counter()
+    for port, status, rtt in scanner.iter_scan(LOOPBACK):
+        statuses[status.name] += 1
+        mismatches += status != expected[port]
+        if rtt is not None:
+            rtts.append(rtt)
+    elapsed = time.perf_counter() - start_time
+
+    stopped.set()
+    sampler.join()
+    rtts.sort()
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak_rss = None
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if platform.system() == 'Darwin':
+            peak_rss //= 1024
+
+    return {
+        'engine': engine,
+        'thread_limit': thread_limit,
+        'probes': sum(statuses.values()),
+        'seconds': elapsed,
+        'probes_per_second': sum(statuses.values()) / elapsed if elapsed else None,
+        'p50_ms': None if not rtts else percentile(rtts, 50) * 1000,
+        'p99_ms': None if not rtts else percentile(rtts, 99) * 1000,
+        'peak_rss_kb': peak_rss,
+        'peak_fds': peak_fds[0] or None,
+        'statuses': dict(statuses),
+        'mismatches': mismatches,
+    }
+
+
+def benchmark(engines, thread_limits, open_count, closed_count, blackholed_count, delay):
+    """
+    Start the stand-in listeners and run every combination of engine and thread limit, each in a fresh
+    process so that peak memory and file descriptor usage are measured run by run.
+
+    :return: the measurements of every run.
+    :rtype: list
+    """
+    listeners = {
+        protocol: Listeners(open_count, closed_count, blackholed_count, protocol)
+        for protocol in set('udp' if engine == 'udp' else 'tcp' for engine in engines)
+    }
+    try:
+        reports = []
+        for engine in engines:
+            if engine == 'syn' and not synscan.is_supported():
+                print('skipping the syn engine, it needs Linux and root privileges.')
+                continue
+            if engine == 'udp' and not udpscan.is_supported():
+                print('skipping the udp engine, it needs Linux to tell closed ports from filtered ones.')
+                continue
+            expected = listeners['udp' if engine == 'udp' else 'tcp'].expected()
+            for thread_limit in thread_limits:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    report = executor.submit(run, expected, engine, thread_limit, delay).result()
+                print_report(report)
+                reports.append(report)
+        return reports
+    finally:
+        for protocol_listeners in listeners.values():
+            protocol_listeners.close()
+
+
+def print_report(report):
+    def number(value, template):
+        return '-' if value is None else template.format(value)
+
+    print('{:<8} {:>7} {:>8} {:>10} {:>9} {:>9} {:>11} {:>7} {:>10}'.format(
+        report['engine'], report['thread_limit'], report['probes'],
+        number(report['probes_per_second'], '{:.0f}'), number(report['p50_ms'], '{:.2f}'),
+        number(report['p99_ms'], '{:.2f}'), number(report['peak_rss_kb'], '{}'), number(report['peak_fds'], '{}'),
+        report['mismatches']
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the port scanner against loopback listeners.')
+    parser.add_argument(
+        '--engines', nargs='+', choices=['thread', 'asyncio', 'syn', 'udp'], default=['thread', 'asyncio'],
+        help='the scanning engines to run'
+    )
+    parser.add_argument('--thread-limits', nargs='+', type=int, default=[100, 1000], help='the thread limits to run')
+    parser.add_argument('--open', type=int, default=10, help='the number of open ports')
+    parser.add_argument('--closed', type=int, default=5000, help='the number of refusing ports')
+    parser.add_argument('--blackholed', type=int, default=10, help='the number of blackholed ports')
+    parser.add_argument('--delay', type=float, default=1.0, help='the timeout delay in seconds')
+    parser.add_argument('--json', help='write the measurements to this file as JSON')
+    args = parser.parse_args()
+
+    print('{:<8} {:>7} {:>8} {:>10} {:>9} {:>9} {:>11} {:>7} {:>10}'.format(
+        'engine', 'threads', 'probes', 'probes/s', 'p50 ms', 'p99 ms', 'peak RSS kB', 'fds', 'mismatches'
+    ))
+    reports = benchmark(args.engines, args.thread_limits, args.open, args.closed, args.blackholed, args.delay)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
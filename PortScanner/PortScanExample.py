@@ -1,7 +1,12 @@
+import logging
+
 import PortScanner as ps
 
 
 def main():
+    # The scanner reports its progress through logging, show it on the console.
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
     # Initialize a Scanner object that will scan top 50 commonly used ports.
     scanner = ps.PortScanner(target_ports=50)
 
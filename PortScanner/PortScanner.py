@@ -1,11 +1,38 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
+import copy
+import errno
+import ipaddress
+import logging
+import os
+import queue
+import random
 import socket
 import platform
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+import differential
+import services
+import sharding
+import synscan
+import udpscan
+from checkpoint import Checkpoint
 from etc import constants
+from portset import PortSet, shuffled
+from ratelimit import CongestionWindow, ProbeGate, TokenBucket
+from resolver import Resolver
+from results import PortStatus, ScanResult
+from scheduler import ProbeScheduler
+from timing import TimeoutEstimator
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, the open file limit is left as it is there.
+    resource = None
 
 
 class PortScanner:
@@ -17,35 +44,105 @@ class PortScanner:
     # default thread number limit
     __thread_limit = 1000
 
+    # file descriptors kept for everything but the connects of the asyncio engine
+    __fd_reserve = 32
+
+    # sockets opened by the asyncio engine and not closed yet
+    __sockets_open = 0
+
     # default connection timeout time in seconds
     __delay = 10
 
+    # default address family of the scanned addresses, AF_INET, AF_INET6 or AF_UNSPEC for both
+    __address_family = socket.AF_INET
+    __address_families = {'ipv4': socket.AF_INET, 'ipv6': socket.AF_INET6, 'any': socket.AF_UNSPEC}
+
+    # socket option set on every TCP socket, Windows has no SO_REUSEPORT.
+    # All systems except for 'Windows' will be treated equally.
+    __reuse_option = socket.SO_REUSEADDR if platform.system() == 'Windows' else socket.SO_REUSEPORT
+
+    # whether the timeout of each host is derived from its measured round trip times, and the bounds
+    # of that adaptive timeout in seconds. None as upper bound means the delay is used.
+    __adaptive_timeout = False
+    __min_delay = 0.1
+    __max_delay = None
+
+    # default scanning engine, 'thread' runs connects on a pool of threads, 'asyncio' keeps every
+    # connect in flight on a single event loop, 'syn' sends half-open probes from a raw socket and
+    # 'udp' scans UDP ports from a single UDP socket
+    __engine = 'thread'
+    __engines = ('thread', 'asyncio', 'syn', 'udp')
+
+    # default probe rates in probes per second over all hosts and per host, None means unlimited
+    __rate_limit = None
+    __host_rate_limit = None
+
+    # whether an AIMD congestion window throttles the number of probes in flight
+    __congestion_control = False
+
+    # default overall scan deadline in seconds, None means it is derived from the delay
+    __scan_deadline = None
+
+    # default number of processes the ports are sharded across, 1 scans in the calling process
+    __processes = 1
+
+    # (shard, shards) of the hosts scanned by this scanner when hosts are split across processes, None for all
+    __host_shard = None
+
+    # path of the file finished probes are checkpointed to, None means no checkpoint is kept
+    __checkpoint = None
+
+    # logger the scanning progress and warnings are reported to, quiet unless logging is configured
+    __logger = logging.getLogger('PortScanner')
+
+    # metrics the probes are counted into, None means the scan is not instrumented
+    __metrics = None
+
+    # whether the service of each open port is detected on the connection that found it open, and the time
+    # in seconds a banner, then the reply to a probe, is waited for
+    __service_detection = False
+    __banner_timeout = 1.0
 
-    @classmethod
-    def __usage(cls):
+    # whether the ports of each host are probed in a random order, and the seed of that order, None for a
+    # new order on every scan
+    __randomize = False
+    __seed = None
+
+    # default maximum number of probes in flight to a single host, None means only the thread limit applies
+    __host_limit = None
+
+    def __usage(self):
         """
-        Return the usage information for invalid input host name.
+        Log the usage information for invalid input host name.
         """
-        print('python Port Scanner v0.1')
-        print('please make sure the input host name is in the form of "something.com" or "http://something.com!"\n')
+        self.__logger.info('python Port Scanner v0.1')
+        self.__logger.info('please make sure the input host name is in the form of "something.com" or "http://something.com!"\n')
 
     def __init__(self, target_ports=None):
         """
         Constructor of a PortScanner object. If target_ports is a list, this list of ports will be used as
         the port list to be scanned. If the target_ports is a int, it should be 50, 100 or 1000, indicating
-        which default list will be used.
+        which default list will be used. If the target_ports is a str or a PortSet, the ports of the set will
+        be scanned.
 
         :param target_ports: if this args is a list, then this list of ports that is going to be scanned,
         default to self.__port_list_top_1000. if this args is an int, then it should be 50, 100 or 1000. And
-        the corresponding default list will be used respectively.
-        :type target_ports: list or int
+        the corresponding default list will be used respectively. if this args is a str, then it is an nmap
+        style port specification such as "1-1024,3306,8000-9000" or "top:100", see PortSet.
+        :type target_ports: list or int or str or PortSet
         """
+        self.__resolver = Resolver()
+
         if target_ports is None:
             self.target_ports = self.__port_list_top_1000
         elif type(target_ports) == list:
             self.target_ports = target_ports
         elif type(target_ports) == int:
             self.target_ports = self.check_default_list(target_ports)
+        elif isinstance(target_ports, str):
+            self.target_ports = PortSet(target_ports)
+        elif isinstance(target_ports, PortSet):
+            self.target_ports = target_ports
 
     def check_default_list(self, target_port_rank):
         """
@@ -78,37 +175,206 @@ class PortScanner:
         :param host_name: the hostname that is going to be scanned
         :param message: the message that is going to be included in the scanning packets
         in order to prevent ethical problem (default: '').
-        :return: a dict object containing the scan results for a given host in the form of
-        {port_number: status}
-        :rtype: dict
+        :return: the scan results for a given host. It can be used as a dict in the form of
+        {port_number: status} in which status is 'OPEN' or 'CLOSE', while the three state status, round
+        trip time, errno and detected service of each port are available through its status(), rtt(), errno()
+        and service() methods.
+        :rtype: ScanResult
         """
-        host_name = str(host_name)
-        if 'http://' in host_name or 'https://' in host_name:
-            host_name = host_name[host_name.find('://') + 3:]
-
-        print('*' * 60 + '\n')
-        print('start scanning website: {}'.format(host_name))
+        host_name = self.__normalize_host_name(host_name)
 
-        try:
-            server_ip = socket.gethostbyname(host_name)
-            print('server ip is: {}'.format(str(server_ip)))
+        self.__logger.info('*' * 60 + '\n')
+        self.__logger.info('start scanning website: {}'.format(host_name))
 
-        except socket.error:
-            # If the DNS resolution of a website cannot be finished, abort that website.
-            print('hostname {} unknown!!!'.format(host_name))
-            self.__usage()
-            return {}
+        server_ip = self.__resolve_host(host_name)
+        if server_ip is None:
+            return ScanResult(host_name)
             # May need to return specific value to indicate the failure.
 
         start_time = time.time()
-        output = self.__scan_ports(server_ip, self.__delay, message.encode('utf-8'))
+        output = self.__scan_ports(host_name, server_ip, self.__delay, message.encode('utf-8'))
         stop_time = time.time()
 
-        print('host {} scanned in  {} seconds'.format(host_name, stop_time - start_time))
-        print('finished scan!\n')
+        self.__logger.info('host {} scanned in  {} seconds'.format(host_name, stop_time - start_time))
+        self.__logger.info('{:.0f} probes per second'.format(len(output) / max(stop_time - start_time, 1e-9)))
+        self.__logger.info('finished scan!\n')
+
+        return output
+
+    def iter_scan(self, host_name, message=''):
+        """
+        Perform port scanning and yield the result of each port as soon as its probe finishes, so that
+        open ports can be handled without waiting for the slowest timeout.
+
+        :param host_name: the hostname that is going to be scanned
+        :param message: the message that is going to be included in the scanning packets
+        in order to prevent ethical problem (default: '').
+        :return: a generator of (port_number, status, rtt) tuples, in which status is a PortStatus and rtt
+        is the round trip time in seconds of the probe, or None if no reply was received.
+        :rtype: generator
+        """
+        host_name = self.__normalize_host_name(host_name)
+        server_ip = self.__resolve_host(host_name)
+        if server_ip is None:
+            return
+
+        results = self.__probe_ports(server_ip, self.target_ports, self.__delay, message.encode('utf-8'))
+        for port_number, status, rtt, err, service in self.__observe(host_name, server_ip, self.target_ports, results):
+            yield port_number, status, rtt
+
+    async def aiter_scan(self, host_name, message=''):
+        """
+        The async iterator version of iter_scan(). Probes run on the running event loop, with the 'syn' or
+        'udp' engine if it is set and the 'asyncio' engine otherwise, so the 'thread' engine is never used.
+        The scan is never sharded across processes, whatever set_processes(), and like iter_scan() it does
+        not record the probes in the checkpoint set by set_checkpoint().
+
+        :param host_name: the hostname that is going to be scanned
+        :param message: the message that is going to be included in the scanning packets
+        in order to prevent ethical problem (default: '').
+        :return: an async generator of (port_number, status, rtt) tuples.
+        """
+        loop = asyncio.get_running_loop()
+        host_name = self.__normalize_host_name(host_name)
+        server_ip = await loop.run_in_executor(None, self.__resolve_host, host_name)
+        if server_ip is None:
+            return
+
+        delay = self.__delay
+        metrics = self.__metrics
+        results = self.__probe_ports_async(
+            server_ip, self.target_ports, delay, message.encode('utf-8'), self.__get_scan_deadline(delay, len(self.target_ports))
+        )
+        if metrics is not None:
+            metrics.host_started(host_name, server_ip, len(self.target_ports))
+        try:
+            async for port_number, status, rtt, err, service in results:
+                if metrics is not None:
+                    metrics.record(host_name, server_ip, port_number, status, rtt, err)
+                yield port_number, status, rtt
+        finally:
+            await results.aclose()
+            if metrics is not None:
+                metrics.host_finished(host_name, server_ip)
+
+    def scan_many(self, targets, message='', all_addresses=False):
+        """
+        Perform port scanning on many hosts at once. Probes of all hosts are interleaved by a single
+        scheduler and share the thread limit as one global budget of probes in flight. This uses the 'syn'
+        or 'udp' engine if it is set, and the 'asyncio' engine otherwise.
+
+        :param targets: a host name, an ip address, a CIDR range such as "10.0.0.0/24", or a list of these
+        :type targets: str or list
+        :param message: the message that is going to be included in the scanning packets
+        in order to prevent ethical problem (default: '').
+        :param all_addresses: if True, every address a host name resolves to in the address family is
+        scanned, otherwise only the preferred one (default: False).
+        :type all_addresses: bool
+        :return: a generator yielding (host, output) pairs as soon as each host is completely scanned,
+        in which output is a ScanResult, see scan(), whose ip attribute tells which address was scanned.
+        Hosts that cannot be resolved are yielded with an empty ScanResult.
+        :rtype: generator
+        """
+        if isinstance(targets, str):
+            targets = [targets]
+        else:
+            targets = list(targets)
+
+        if self.__processes > 1:
+            return self.__scan_many_sharded(targets, message, all_addresses)
+
+        return self.__iterate_async(
+            self.__scan_many_async(targets, self.__delay, message.encode('utf-8'), all_addresses)
+        )
 
+    def scan_addresses(self, host_name, message=''):
+        """
+        Perform port scanning on every address a host name resolves to in the address family, for example
+        on both the IPv4 and the IPv6 addresses of a dual-stack host with set_address_family('any').
+
+        :param host_name: the hostname that is going to be scanned
+        :param message: the message that is going to be included in the scanning packets
+        in order to prevent ethical problem (default: '').
+        :return: a dict in the form of {ip: ScanResult}, empty if the host name cannot be resolved.
+        :rtype: dict
+        """
+        output = {}
+        for name, result in self.scan_many([host_name], message, all_addresses=True):
+            if result.ip is not None:
+                output[result.ip] = result
         return output
 
+    def rescan(self, targets, snapshot, message='', sample=0.1, rotation=None, all_addresses=False):
+        """
+        Perform a differential rescan of many hosts against a previous snapshot. On each host the ports that
+        were open in the snapshot are probed first, followed by a rotating sample of the other target ports,
+        so that successive rescans cover every port while each of them only probes a fraction. Hosts missing
+        from the snapshot are scanned on every target port. Like scan_many(), this uses the 'syn' or 'udp'
+        engine if it is set, and the 'asyncio' engine otherwise, and always runs in the calling process.
+        The probes are appended to the checkpoint if one is set, but ports it already records are probed again.
+
+        :param targets: a host name, an ip address, a CIDR range such as "10.0.0.0/24", or a list of these
+        :type targets: str or list
+        :param snapshot: the ScanResults of a previous scan, such as the outputs of scan() or scan_many(),
+        or the path of a checkpoint file written by a previous scan, see set_checkpoint()
+        :type snapshot: iterable or str
+        :param message: the message that is going to be included in the scanning packets
+        in order to prevent ethical problem (default: '').
+        :param sample: the fraction of the ports that were not open which is probed, default to 0.1.
+        :type sample: float
+        :param rotation: the index of the sample of ports probed, default to the number of days since the
+        epoch, so that nightly rescans cover every port once every 1 / sample nights.
+        :type rotation: int
+        :param all_addresses: if True, every address a host name resolves to in the address family is
+        scanned, otherwise only the preferred one (default: False).
+        :type all_addresses: bool
+        :return: a generator yielding (host, changes, output) tuples as soon as each host is completely
+        scanned. changes is a list of (port, before, after) tuples for every port that has been opened or
+        closed since the snapshot, in which before is the previous PortStatus, or None if the port has never
+        been probed, and after is the new PortStatus. output is the snapshot of the host updated with the
+        new results, to be used by the next rescan.
+        :rtype: generator
+        """
+        sample = float(sample)
+        if sample < 0 or sample > 1:
+            raise ValueError('Invalid sample {}. Should be within the range of [0, 1].'.format(sample))
+
+        if isinstance(targets, str):
+            targets = [targets]
+        else:
+            targets = list(targets)
+        previous = differential.load(snapshot)
+
+        def plan(ip, ports):
+            output = previous.get(ip)
+            planned = differential.plan(output, ports, sample, rotation)
+            if output is None:
+                return planned, 0
+            # The ports that were open keep their place at the head, only the sample of the others is randomized.
+            opened = set(output.open_ports())
+            return planned, sum(1 for port in planned if port in opened)
+
+        results = self.__iterate_async(
+            self.__scan_many_async(targets, self.__delay, message.encode('utf-8'), all_addresses, plan)
+        )
+        return self.__compare(previous, results)
+
+    @staticmethod
+    def __compare(previous, results):
+        """
+        Compare the results of a rescan with the snapshot they have been planned from, see rescan().
+
+        :param previous: the snapshot in the form of {ip: ScanResult}
+        :type previous: dict
+        :param results: the (host, ScanResult) pairs of the rescan
+        :type results: iterable
+        :return: a generator of (host, changes, output) tuples.
+        :rtype: generator
+        """
+        for host, output in results:
+            before = previous.get(output.ip)
+            yield host, differential.changes(before, output), differential.merge(before, output)
+
     def set_thread_limit(self, limit):
         """
         Set the maximum number of thread for port scanning
@@ -118,11 +384,11 @@ class PortScanner:
         limit = int(limit)
 
         if limit <= 0 or limit > 50000:
-            print(
+            self.__logger.warning(
                 'Warning: Invalid thread number limit {}!'
                 'Please make sure the thread limit is within the range of (1, 50,000)!'.format(limit)
             )
-            print('The scanning process will use default thread limit 1,000.')
+            self.__logger.warning('The scanning process will use default thread limit 1,000.')
             return
 
         self.__thread_limit = limit
@@ -132,18 +398,314 @@ class PortScanner:
         Set the time out delay for port scanning in seconds
 
         :param delay: the time in seconds that a TCP socket waits until timeout, default to 10s.
+        Sub-second delays such as 0.25 are accepted.
+        :type delay: float
         """
-        delay = int(delay)
+        delay = float(delay)
         if delay <= 0 or delay > 100:
-            print(
+            self.__logger.warning(
                 'Warning: Invalid delay value {} seconds!'
-                'Please make sure the input delay is within the range of (1, 100)'.format(delay)
+                'Please make sure the input delay is within the range of (0, 100]'.format(delay)
             )
-            print('The scanning process will use the default delay time 10 seconds.')
+            self.__logger.warning('The scanning process will use the default delay time 10 seconds.')
             return
 
         self.__delay = delay
 
+    def set_adaptive_timeout(self, enabled, min_delay=0.1, max_delay=None):
+        """
+        Enable or disable the adaptive timeout. When enabled, the timeout of each host is derived from the
+        round trip times of its accepted or refused connects (smoothed round trip time plus four times its
+        variation), bounded by min_delay and max_delay. Until the first reply the delay is used.
+
+        :param enabled: whether the adaptive timeout is used, default to False.
+        :type enabled: bool
+        :param min_delay: the lower bound of the adaptive timeout in seconds, default to 0.1s.
+        :type min_delay: float
+        :param max_delay: the upper bound of the adaptive timeout in seconds, or None to use the delay.
+        :type max_delay: float
+        """
+        min_delay = float(min_delay)
+        max_delay = None if max_delay is None else float(max_delay)
+        if min_delay <= 0 or (max_delay is not None and max_delay < min_delay):
+            self.__logger.warning(
+                'Warning: Invalid adaptive timeout bounds ({}, {})! '
+                'Please make sure 0 < min_delay <= max_delay.'.format(min_delay, max_delay)
+            )
+            self.__logger.warning('The scanning process will keep the current timeout settings.')
+            return
+
+        self.__adaptive_timeout = bool(enabled)
+        self.__min_delay = min_delay
+        self.__max_delay = max_delay
+
+    def set_rate_limit(self, rate=None, host_rate=None):
+        """
+        Set the maximum number of probes sent per second, enforced by token buckets.
+
+        :param rate: the maximum number of probes per second over all hosts, or None for no limit.
+        :type rate: float
+        :param host_rate: the maximum number of probes per second to a single host, or None for no limit.
+        :type host_rate: float
+        """
+        rate = None if rate is None else float(rate)
+        host_rate = None if host_rate is None else float(host_rate)
+        if (rate is not None and rate <= 0) or (host_rate is not None and host_rate <= 0):
+            self.__logger.warning(
+                'Warning: Invalid rate limit ({}, {})! '
+                'Please make sure the rates are positive or None.'.format(rate, host_rate)
+            )
+            self.__logger.warning('The scanning process will keep the current rate limits.')
+            return
+
+        self.__rate_limit = rate
+        self.__host_rate_limit = host_rate
+
+    def set_congestion_control(self, enabled):
+        """
+        Enable or disable the congestion control. When enabled, the number of probes in flight is bounded by
+        an AIMD congestion window that grows while probes are answered and halves when they time out, up to
+        the thread limit.
+
+        :param enabled: whether the congestion control is used, default to False.
+        :type enabled: bool
+        """
+        self.__congestion_control = bool(enabled)
+
+    def set_address_family(self, family):
+        """
+        Set the address family host names are resolved into.
+
+        :param family: 'ipv4', 'ipv6', or 'any' for both, in which case the preferred address of getaddrinfo is
+        scanned first, default to 'ipv4'.
+        :type family: str
+        """
+        family = str(family).lower()
+        if family not in self.__address_families:
+            self.__logger.warning(
+                'Warning: Invalid address family {}! '
+                'Please make sure the family is one of {}.'.format(family, ', '.join(self.__address_families))
+            )
+            self.__logger.warning('The scanning process will keep the current address family.')
+            return
+
+        self.__address_family = self.__address_families[family]
+
+    def set_dns_cache(self, ttl=300, max_size=4096):
+        """
+        Set how long and how many DNS resolutions are cached by the scanner. The cache is emptied.
+
+        :param ttl: the time in seconds a resolved address is cached, default to 300s. 0 disables the cache.
+        :type ttl: float
+        :param max_size: the maximum number of cached host names, default to 4096.
+        :type max_size: int
+        """
+        ttl = float(ttl)
+        max_size = int(max_size)
+        if ttl < 0 or max_size <= 0:
+            self.__logger.warning(
+                'Warning: Invalid DNS cache settings ({}, {})! '
+                'Please make sure the ttl is not negative and the size is positive.'.format(ttl, max_size)
+            )
+            self.__logger.warning('The scanning process will keep the current DNS cache settings.')
+            return
+
+        self.__resolver.ttl = ttl
+        self.__resolver.negative_ttl = min(ttl, self.__resolver.negative_ttl)
+        self.__resolver.max_size = max_size
+        self.__resolver.clear()
+
+    def set_scan_deadline(self, deadline):
+        """
+        Set the overall deadline of a scan in seconds. Ports that are not resolved before the deadline
+        are reported as FILTERED with errno ECANCELED, so a scan never hangs on a stuck probe. They are not
+        recorded in the checkpoint, so a resumed scan probes them again. In scan_many(), rescan() and a scan
+        sharded across processes, the deadline applies to each host from its first probe on.
+
+        :param deadline: the overall scan deadline in seconds, or None to derive it from the delay and the
+        thread limit, default to None.
+        :type deadline: float
+        """
+        if deadline is None:
+            self.__scan_deadline = None
+            return
+
+        deadline = float(deadline)
+        if deadline <= 0:
+            self.__logger.warning('Warning: Invalid scan deadline {} seconds! Please make sure the deadline is positive.'.format(deadline))
+            self.__logger.warning('The scanning process will derive the scan deadline from the delay.')
+            return
+
+        self.__scan_deadline = deadline
+
+    def set_processes(self, processes=None):
+        """
+        Set the number of processes the target ports are sharded across. Each process scans its shard of
+        the ports on its own event loop, with the 'syn' or 'udp' engine if it is set and the 'asyncio' engine otherwise,
+        and the results are merged back into the output of scan() and scan_many(). The thread limit and the
+        rate limits are split evenly between the processes. scan_many() splits the hosts instead of the ports
+        when there are at least as many hosts as processes, or fewer ports, so that each host is scanned by
+        a single process.
+
+        :param processes: the number of processes, or None for one per CPU core, default to 1 which scans
+        in the calling process.
+        :type processes: int
+        """
+        processes = (os.cpu_count() or 1) if processes is None else int(processes)
+        if processes <= 0 or processes > 256:
+            self.__logger.warning(
+                'Warning: Invalid number of processes {}! '
+                'Please make sure the number of processes is within the range of (1, 256)!'.format(processes)
+            )
+            self.__logger.warning('The scanning process will keep using {} processes.'.format(self.__processes))
+            return
+
+        self.__processes = processes
+
+    def set_checkpoint(self, path=None, resume=True):
+        """
+        Set the file that finished probes of scan() and scan_many() are appended to as JSON Lines, so that a
+        crashed or interrupted scan can be resumed. Probes already recorded in the file are skipped, and their
+        recorded results are returned along with the new ones.
+
+        :param path: the path of the checkpoint file, or None to keep no checkpoint, default to None.
+        :type path: str
+        :param resume: whether the probes recorded in an existing checkpoint file are kept, otherwise the file
+        is emptied, default to True.
+        :type resume: bool
+        """
+        if path is None:
+            self.__checkpoint = None
+            return
+
+        path = str(path)
+        if os.path.isdir(path):
+            self.__logger.warning('Warning: Invalid checkpoint file {}! Please make sure the path is not a directory.'.format(path))
+            self.__logger.warning('The scanning process will keep the current checkpoint settings.')
+            return
+
+        if not resume:
+            Checkpoint.discard(path)
+        self.__checkpoint = path
+
+    def set_logger(self, logger=None):
+        """
+        Set the logger the scanning progress (at INFO level) and warnings are reported to. Progress is not
+        shown unless logging is configured, for example with logging.basicConfig(level=logging.INFO).
+
+        :param logger: a logging.Logger, or None for the 'PortScanner' logger, default to None.
+        :type logger: logging.Logger
+        """
+        self.__logger = logging.getLogger('PortScanner') if logger is None else logger
+
+    def set_metrics(self, metrics=None):
+        """
+        Set the metrics the probes of every scan are counted into. The number of probes in flight, the probe
+        rate, the timeout rate, the round trip time histogram and the progress of each host can then be read
+        from the metrics or exported with their prometheus() method while scans are running.
+        In sharded scans, the probes in flight are not counted and hosts are counted once every shard is done.
+
+        :param metrics: a ScanMetrics, or None to stop counting, default to None.
+        :type metrics: ScanMetrics
+        """
+        self.__metrics = metrics
+
+    def set_service_detection(self, enabled, timeout=1.0):
+        """
+        Enable or disable service detection. When a connect succeeds, the banner the service sends is read on
+        the same connection, or a protocol probe is sent if it sends none, and the reply is matched against the
+        signatures of the services module. The name of the service is then available through the service()
+        method of the results. Open ports take up to twice the timeout longer to be resolved.
+        The 'syn' and 'udp' engines never complete a handshake, so they do not detect services.
+
+        :param enabled: whether the services of open ports are detected, default to False.
+        :type enabled: bool
+        :param timeout: the time in seconds a banner, then the reply to a probe, is waited for, default to 1.
+        :type timeout: float
+        """
+        timeout = float(timeout)
+        if timeout <= 0:
+            self.__logger.warning('Warning: Invalid banner timeout {} seconds! Please make sure the timeout is positive.'.format(timeout))
+            self.__logger.warning('The scanning process will keep the current service detection settings.')
+            return
+
+        self.__service_detection = bool(enabled)
+        self.__banner_timeout = timeout
+
+    def set_randomize(self, enabled, seed=None):
+        """
+        Enable or disable the random order of probes. The ports of each host are walked through a random
+        permutation that is computed on the fly, so even the full port space is never shuffled in memory, and
+        in batch scans the hosts take turns, so that no host receives a long run of consecutive probes. Unless
+        a host limit is set, see set_host_limit(), scan_many() then keeps as many hosts in progress as there are
+        probes in flight, so that the window is spread over the hosts rather than sent to a few of them.
+        A rescan still probes the ports that were open first and in order, and randomizes the sample of the
+        other ports.
+
+        :param enabled: whether the ports of each host are probed in a random order, default to False.
+        :type enabled: bool
+        :param seed: the seed of the random order, or None for a new order on every scan, default to None.
+        :type seed: int
+        """
+        self.__randomize = bool(enabled)
+        self.__seed = seed
+
+    def set_host_limit(self, limit=None):
+        """
+        Set the maximum number of probes in flight to a single host, on top of the thread limit, so that
+        batch scans spread the probes in flight over at least thread limit / limit hosts instead of
+        hammering one host at a time.
+
+        :param limit: the maximum number of probes in flight to a single host, or None for no limit other than
+        the thread limit, default to None.
+        :type limit: int
+        """
+        if limit is None:
+            self.__host_limit = None
+            return
+
+        limit = int(limit)
+        if limit <= 0:
+            self.__logger.warning('Warning: Invalid host limit {}! Please make sure the limit is positive.'.format(limit))
+            self.__logger.warning('The scanning process will keep using the current host limit.')
+            return
+
+        self.__host_limit = limit
+
+    def set_engine(self, engine):
+        """
+        Set the scanning engine used for port scanning
+
+        :param engine: 'thread' to use a pool of threads, 'asyncio' to perform non-blocking connects
+        on a single event loop, 'syn' to send half-open SYN probes from a single raw socket, or 'udp' to scan
+        UDP ports from a single UDP socket, default to 'thread'. With the 'asyncio', 'syn' and 'udp' engines
+        the thread limit bounds the number of probes in flight instead of the number of threads, and the rate
+        limits and congestion control apply to every engine. The 'syn' engine needs Linux and root privileges.
+        The 'udp' engine sends a payload the services of well known ports answer to, and the message to other
+        ports. A reply means the port is OPEN, an ICMP port unreachable that it is CLOSED, and no reply that it
+        is FILTERED or open but silent. ICMP errors are only read on Linux, elsewhere no port is ever CLOSED.
+        :type engine: str
+        """
+        engine = str(engine).lower()
+        if engine not in self.__engines:
+            self.__logger.warning(
+                'Warning: Invalid scanning engine {}! '
+                'Please make sure the engine is one of {}.'.format(engine, ', '.join(self.__engines))
+            )
+            self.__logger.warning('The scanning process will use the default engine thread.')
+            return
+
+        if engine == 'syn' and not synscan.is_supported():
+            self.__logger.warning('Warning: The syn engine needs Linux and root privileges!')
+            self.__logger.warning('The scanning process will keep using the {} engine.'.format(self.__engine))
+            return
+
+        if engine == 'udp' and not udpscan.is_supported():
+            self.__logger.warning('Warning: The udp engine cannot read ICMP errors on this system!')
+            self.__logger.warning('Closed UDP ports will be reported as FILTERED.')
+
+        self.__engine = engine
+
     def show_target_ports(self):
         """
         Print out and return the list of ports being scanned.
@@ -165,6 +727,28 @@ class PortScanner:
         print ('Current timeout delay is {} seconds.'.format(self.__delay))
         return self.__delay
 
+    def show_engine(self):
+        """
+        Print out and return the scanning engine in use.
+
+        :return: name of the scanning engine, 'thread', 'asyncio', 'syn' or 'udp'.
+        :rtype: str
+        """
+        print ('Current scanning engine is {}.'.format(self.__engine))
+        return self.__engine
+
+    def show_scan_deadline(self):
+        """
+        Print out and return the overall deadline of a scan in seconds.
+
+        :return: the overall scan deadline in seconds, or None if it is derived from the delay.
+        :rtype: float
+        """
+        print ('Current scan deadline is {}.'.format(
+            'derived from the delay' if self.__scan_deadline is None else '{} seconds'.format(self.__scan_deadline)
+        ))
+        return self.__scan_deadline
+
     def show_top_k_ports(self, k):
         """
         Print out and return top K commonly used ports. K should be 50, 100 or 1000.
@@ -179,65 +763,807 @@ class PortScanner:
         print(port_list)
         return port_list
 
-    def __scan_ports_helper(self, ip, delay, output, message):
+    def __resolve_host(self, host_name):
+        """
+        Resolve a host name into an ip address.
+
+        :param host_name: the bare host name
+        :type host_name: str
+        :return: the ip address of the host, or None if it cannot be resolved.
+        :rtype: str
         """
-        Open multiple threads to perform port scanning
+        server_ips = self.__resolve_all(host_name)
+        server_ip = server_ips[0] if server_ips else None
+        if server_ip is None:
+            # If the DNS resolution of a website cannot be finished, abort that website.
+            self.__logger.warning('hostname {} unknown!!!'.format(host_name))
+            self.__usage()
+            return None
+
+        self.__logger.info('server ip is: {}'.format(str(server_ip)))
+        return server_ip
+
+    def __resolve_all(self, host_name):
+        """
+        Resolve a host name into every address of the address family. An ip address is used as it is,
+        whatever the address family.
+
+        :param host_name: the bare host name
+        :type host_name: str
+        :return: the ip addresses of the host, empty if it cannot be resolved.
+        :rtype: list
+        """
+        try:
+            return [str(ipaddress.ip_address(host_name))]
+        except ValueError:
+            return self.__resolver.resolve_all(host_name, self.__address_family)
+
+    def __resolve_many(self, host_names):
+        """
+        Resolve many host names concurrently into every address of the address family, see __resolve_all().
+
+        :param host_names: the bare host names
+        :type host_names: list
+        :return: a dict in the form of {host_name: ips}, in which ips is empty if the host cannot be resolved.
+        :rtype: dict
+        """
+        addresses = {}
+        for host_name in host_names:
+            try:
+                addresses[host_name] = [str(ipaddress.ip_address(host_name))]
+            except ValueError:
+                pass
+        addresses.update(self.__resolver.resolve_many(
+            [host_name for host_name in host_names if host_name not in addresses], self.__address_family
+        ))
+        return addresses
+
+    @staticmethod
+    def __normalize_host_name(host_name):
+        """
+        Strip the http:// or https:// prefix, and the brackets of an IPv6 address, off a host name.
+
+        :param host_name: the hostname that is going to be scanned
+        :return: the bare host name.
+        :rtype: str
+        """
+        host_name = str(host_name)
+        if 'http://' in host_name or 'https://' in host_name:
+            host_name = host_name[host_name.find('://') + 3:]
+        if host_name.startswith('[') and host_name.endswith(']'):
+            # IPv6 address in the URL form of "[::1]"
+            host_name = host_name[1:-1]
+        return host_name
+
+    def __expand_targets(self, targets, failed, all_addresses, addresses=None):
+        """
+        Lazily expand the scanning targets into (name, ip) pairs. CIDR ranges are walked address by
+        address so that large ranges are never held in memory.
+
+        :param targets: an iterable of host names, ip addresses and CIDR ranges
+        :type targets: iterable
+        :param failed: a list to which the names of unresolvable hosts are appended
+        :type failed: list
+        :param all_addresses: whether a host name is expanded into every address it resolves to
+        :type all_addresses: bool
+        :param addresses: the host names resolved up front, in the form of {host_name: ips}, see
+        __resolve_many(). Other host names are resolved as they are reached.
+        :type addresses: dict
+        :return: a generator of (name, ip) pairs
+        :rtype: generator
+        """
+        for target in targets:
+            target = self.__normalize_host_name(target)
+
+            if '/' in target:
+                try:
+                    network = ipaddress.ip_network(target, strict=False)
+                except ValueError:
+                    failed.append(target)
+                    continue
+                for address in network.hosts() if network.num_addresses > 2 else iter(network):
+                    if self.__owns(str(address)):
+                        yield str(address), str(address)
+                continue
+
+            if not self.__owns(target):
+                continue
+            server_ips = addresses.get(target) if addresses is not None else None
+            if server_ips is None:
+                server_ips = self.__resolve_all(target)
+            if not server_ips:
+                self.__logger.warning('hostname {} unknown!!!'.format(target))
+                failed.append(target)
+                continue
+            for server_ip in server_ips if all_addresses else server_ips[:1]:
+                yield target, server_ip
+
+    @staticmethod
+    def __iterate_async(async_iterable):
+        """
+        Drive an async iterable on an event loop in a background thread and yield its items.
+        The scan keeps making progress while the caller is busy with an item, and closing
+        the generator early cancels the outstanding probes.
+
+        :param async_iterable: the async iterable to be driven
+        :return: a generator yielding the items of async_iterable
+        :rtype: generator
+        """
+        items = queue.Queue()
+        finished = object()
+
+        async def pump():
+            try:
+                async for item in async_iterable:
+                    items.put((item, None))
+            except BaseException as e:
+                items.put((finished, e))
+                raise
+            finally:
+                await async_iterable.aclose()
+            items.put((finished, None))
+
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(pump())
+
+        def run():
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(task)
+            except BaseException:
+                # The exception has been handed over to the consumer through the queue.
+                pass
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            while True:
+                item, error = items.get()
+                if item is finished:
+                    if error is not None and not isinstance(error, asyncio.CancelledError):
+                        raise error
+                    return
+                yield item
+        finally:
+            if not task.done():
+                loop.call_soon_threadsafe(task.cancel)
+            thread.join()
+
+    async def __scan_many_async(self, targets, delay, message, all_addresses, plan=None):
+        """
+        Scan many hosts on a single event loop. A fixed pool of workers pulls (host, port) probes from
+        a ProbeScheduler, so at most self.__thread_limit connects are in flight across all hosts.
+        The scan deadline applies to each host from its first probe on, and the probes of a host still
+        unresolved when it passes are given up on.
+
+        :param targets: an iterable of host names, ip addresses and CIDR ranges
+        :type targets: iterable
+        :param delay: the time in seconds that a TCP socket waits until timeout
+        :type delay: int
+        :param message: the message that is going to be included in the scanning packets,
+        in order to prevent ethical problem, default to ''.
+        :type message: str
+        :param all_addresses: whether a host name is expanded into every address it resolves to
+        :type all_addresses: bool
+        :param plan: a function taking an ip address and the list of target ports, and returning the ports to
+        be probed on that address together with the number of leading ones that are probed first and in order
+        even if the scan is randomized, or None to probe every target port
+        :type plan: function
+        :return: an async generator yielding (host, ScanResult) pairs as each host completes.
+        """
+        results = asyncio.Queue()
+        failed = []
+
+        # Resolve every host name concurrently up front, so that admitting hosts never waits on DNS.
+        host_names = [self.__normalize_host_name(target) for target in targets]
+        host_names = [host_name for host_name in host_names if '/' not in host_name and self.__owns(host_name)]
+        addresses = {}
+        if host_names:
+            addresses = await asyncio.get_running_loop().run_in_executor(None, self.__resolve_many, host_names)
 
+        UDP_socks, prober = self.__open_probe_sockets(message)
+        workers = self.__worker_limit(prober)
+
+        # Admit just enough hosts to keep the window full, plus one more to cover each host's tail.
+        host_group_size = workers // max(1, len(self.target_ports)) + 1
+        if self.__host_limit is not None:
+            host_group_size = max(host_group_size, -(-workers // self.__host_limit))
+        elif self.__randomize:
+            # Without a cap, spread the probes in flight over as many hosts as there are workers.
+            host_group_size = max(host_group_size, workers)
+        checkpoint = self.__open_checkpoint()
+
+        def restore(name, ip, ports):
+            if plan is not None:
+                # A rescan probes its planned ports again, whatever the checkpoint already records for them.
+                return (ScanResult(name, ip),) + plan(ip, ports)
+            return checkpoint.restore(name, ip, ports) + (0,)
+
+        scheduler = ProbeScheduler(
+            self.__expand_targets(targets, failed, all_addresses, addresses), self.target_ports, host_group_size,
+            None if plan is None and checkpoint is None else restore, self.__new_rng(), self.__host_limit
+        )
+
+        # The global rate limit and the congestion window are shared by all hosts.
+        global_bucket = self.__new_bucket(self.__rate_limit)
+        window = self.__new_window()
+        metrics = self.__metrics
+        loop = asyncio.get_running_loop()
+        # worker task -> the host it is waiting on a probe of, or None
+        probing = {}
+        stopping = asyncio.Event()
+
+        def give_up(host):
+            # The deadline of the host has passed, its probes in flight are cancelled.
+            host.expired = True
+            for task, probed in probing.items():
+                if probed is host:
+                    task.cancel()
+
+        async def worker():
+            task = asyncio.current_task()
+            while True:
+                probe = scheduler.next_probe()
+                while failed:
+                    name = failed.pop()
+                    results.put_nowait((name, ScanResult(name)))
+                while scheduler.finished:
+                    host = scheduler.finished.pop()
+                    if metrics is not None:
+                        metrics.host_finished(host.name, host.ip, host.output)
+                    results.put_nowait((host.name, host.output))
+                if probe is None:
+                    return
+
+                host, port_number = probe
+                if host.timing is None:
+                    host.timing = self.__new_timing(delay)
+                    host.gate = self.__new_gate(global_bucket, window)
+                    deadline = self.__get_scan_deadline(delay, host.pending, host_group_size)
+                    host.timer = loop.call_at(loop.time() + deadline, give_up, host)
+                    if metrics is not None:
+                        metrics.host_started(host.name, host.ip, host.pending)
+                # One timer per host rather than one per probe keeps the deadline off the hot path.
+                status, rtt, err, service = PortStatus.FILTERED, None, errno.ECANCELED, None
+                if not host.expired:
+                    probing[task] = host
+                    try:
+                        status, rtt, err, service = await self.__TCP_probe_async(
+                            host.ip, port_number, host.timing, host.gate, message, UDP_socks, prober
+                        )
+                    except asyncio.CancelledError:
+                        # Only the deadline of the host is caught here, the end of the scan cancels the worker.
+                        if stopping.is_set() or not host.expired:
+                            raise
+                    finally:
+                        probing[task] = None
+                host.output.add(port_number, status, rtt, err, service)
+                if checkpoint is not None and err != errno.ECANCELED:
+                    checkpoint.record(host.name, host.ip, port_number, status, rtt, err, service)
+                if metrics is not None:
+                    metrics.record(host.name, host.ip, port_number, status, rtt, err)
+                if scheduler.complete(host):
+                    host.timer.cancel()
+                    if metrics is not None:
+                        metrics.host_finished(host.name, host.ip, host.output)
+                    results.put_nowait((host.name, host.output))
+
+        async def run():
+            try:
+                await asyncio.gather(*[worker() for _ in range(workers)])
+            finally:
+                results.put_nowait(None)
+
+        runner = asyncio.ensure_future(run())
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield result
+            await runner
+
+        finally:
+            stopping.set()
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+            self.__close_probe_sockets(UDP_socks, prober)
+            if checkpoint is not None:
+                checkpoint.close()
+
+    def __observe(self, host_name, ip, ports, results):
+        """
+        Count the probes of a host into the metrics as they are yielded.
+
+        :param host_name: the hostname that is being scanned
+        :type host_name: str
         :param ip: the ip address that is being scanned
         :type ip: str
+        :param ports: the list of ports that is going to be probed
+        :type ports: list
+        :param results: the (port, status, rtt, errno, service) tuples of the probes, see __probe_ports()
+        :type results: iterable
+        :return: a generator of the same tuples.
+        :rtype: generator
+        """
+        metrics = self.__metrics
+        if metrics is None:
+            for result in results:
+                yield result
+            return
+
+        metrics.host_started(host_name, ip, len(ports))
+        try:
+            for result in results:
+                metrics.record(host_name, ip, *result[:4])
+                yield result
+        finally:
+            metrics.host_finished(host_name, ip)
+
+    def __open_checkpoint(self):
+        """
+        Open the checkpoint file, if one has been set.
+
+        :return: the checkpoint, or None.
+        :rtype: Checkpoint
+        """
+        if self.__checkpoint is None:
+            return None
+        return Checkpoint(self.__checkpoint)
+
+    def __probe_ports(self, ip, ports, delay, message):
+        """
+        Probe the given ports of the given ip address with the configured engine and yield
+        the results in the order in which the probes finish.
+
+        :param ip: the ip address that is being scanned
+        :type ip: str
+        :param ports: the list of ports that is going to be probed
+        :type ports: list
         :param delay: the time in seconds that a TCP socket waits until timeout
         :type delay: int
-        :param output: a dict that stores result in {port, status} style pairs.
-        status can be 'OPEN' or 'CLOSE'.
-        :type output: dict
         :param message: the message that is going to be included in the scanning packets,
         in order to prevent ethical problem, default to ''.
         :type message: str
+        :return: a generator of (port, status, rtt, errno, service) tuples.
+        :rtype: generator
+        """
+        if self.__processes > 1:
+            return self.__probe_ports_sharded(ip, ports, message)
+
+        deadline = self.__get_scan_deadline(delay, len(ports))
+
+        if self.__engine in ('asyncio', 'syn', 'udp'):
+            return self.__iterate_async(self.__probe_ports_async(ip, ports, delay, message, deadline))
+        return self.__probe_ports_threaded(ip, ports, delay, message, deadline)
+
+    def __new_shards(self, ports, split_hosts=False):
+        """
+        Create one scanner per shard of the given ports, or of the hosts, each with its share of the thread
+        limit and of the rate limits. A host scanned by a single shard keeps the whole per host limits.
+
+        :param ports: the list of ports that is going to be sharded
+        :type ports: list
+        :param split_hosts: whether the hosts are split across the shards instead of the ports
+        :type split_hosts: bool
+        :return: the scanners of the shards.
+        :rtype: list
+        """
+        port_shards = [ports] * self.__processes if split_hosts else sharding.split(ports, self.__processes)
+        scanners = []
+        for shard, ports in enumerate(port_shards):
+            scanner = copy.copy(self)
+            scanner.target_ports = ports
+            scanner.__processes = 1
+            # Probes are counted by the calling process as the shards come back.
+            scanner.__metrics = None
+            scanner.__thread_limit = max(1, self.__thread_limit // len(port_shards))
+            if self.__rate_limit is not None:
+                scanner.__rate_limit = self.__rate_limit / len(port_shards)
+            if split_hosts:
+                scanner.__host_shard = (shard, len(port_shards))
+            else:
+                if self.__host_limit is not None:
+                    scanner.__host_limit = max(1, self.__host_limit // len(port_shards))
+                if self.__host_rate_limit is not None:
+                    scanner.__host_rate_limit = self.__host_rate_limit / len(port_shards)
+            scanners.append(scanner)
+        return scanners
+
+    def __owns(self, host):
+        """
+        :param host: the host name or ip address
+        :type host: str
+        :return: whether the host is scanned by this scanner, which is always the case unless the hosts
+        are split across processes.
+        :rtype: bool
+        """
+        return self.__host_shard is None or sharding.owns(host, *self.__host_shard)
+
+    def __scan_many_sharded(self, targets, message, all_addresses):
+        """
+        Scan many hosts with the target ports sharded across self.__processes processes, see scan_many().
+
+        :param targets: a list of host names, ip addresses and CIDR ranges
+        :type targets: list
+        :param message: the message that is going to be included in the scanning packets
+        :type message: str
+        :param all_addresses: whether a host name is expanded into every address it resolves to
+        :type all_addresses: bool
+        :return: a generator yielding (host, ScanResult) pairs as soon as every shard has scanned the host.
+        :rtype: generator
         """
-        port_index = 0
+        # Resolve up front, the warm cache is handed over to every process along with its scanner,
+        # and unresolvable hosts are reported once here instead of once per process.
+        host_names = [self.__normalize_host_name(target) for target in targets]
+        addresses = self.__resolve_many([host_name for host_name in host_names if '/' not in host_name])
 
-        while port_index < len(self.target_ports):
-            # Ensure the number of concurrently running threads does not exceed the thread limit
-            while threading.activeCount() < self.__thread_limit and port_index < len(self.target_ports):
-                # Start threads
-                thread = threading.Thread(target=self.__TCP_connect,
-                                          args=(ip, self.target_ports[port_index], delay, output, message))
-                thread.start()
-                port_index = port_index + 1
-            time.sleep(0.01)
+        resolved = []
+        hosts = 0
+        for host_name in host_names:
+            if '/' in host_name:
+                resolved.append(host_name)
+                try:
+                    hosts += ipaddress.ip_network(host_name, strict=False).num_addresses
+                except ValueError:
+                    pass
+            elif addresses[host_name]:
+                resolved.append(host_name)
+                hosts += 1
+            else:
+                self.__logger.warning('hostname {} unknown!!!'.format(host_name))
+                yield host_name, ScanResult(host_name)
+
+        if resolved:
+            # Split the hosts rather than the ports when there are enough of them to keep every process busy,
+            # or too few ports, so that each host is scanned by a single process.
+            split_hosts = hosts >= self.__processes or len(self.target_ports) < self.__processes
+            shards = self.__new_shards(self.target_ports, split_hosts)
+            metrics = self.__metrics
+            for host, output in sharding.scan(shards, resolved, message, all_addresses, split_hosts):
+                if metrics is not None:
+                    for record in output.records():
+                        metrics.record(host, output.ip, *record)
+                    metrics.host_finished(host, output.ip, output)
+                yield host, output
+
+    def __probe_ports_sharded(self, ip, ports, message):
+        """
+        Probe the given ports of the given ip address with the ports sharded across self.__processes
+        processes. The results are yielded once every shard has finished.
+
+        :param ip: the ip address that is being scanned
+        :type ip: str
+        :param ports: the list of ports that is going to be probed
+        :type ports: list
+        :param message: the message that is going to be included in the scanning packets,
+        in order to prevent ethical problem, default to ''.
+        :type message: str
+        :return: a generator of (port, status, rtt, errno, service) tuples.
+        :rtype: generator
+        """
+        for host, output in sharding.scan(self.__new_shards(ports), [ip], message.decode('utf-8')):
+            for record in output.records():
+                yield record + (output.service(record[0]),)
 
-    def __scan_ports(self, ip, delay, message):
+    def __probe_ports_threaded(self, ip, ports, delay, message, deadline):
         """
-        Controller of the __scan_ports_helper() function
+        Probe ports on a pool of at most self.__thread_limit threads. Results are yielded as soon as each
+        probe resolves, and every probe still unresolved when the deadline passes is given up on.
 
         :param ip: the ip address that is being scanned
         :type ip: str
+        :param ports: the list of ports that is going to be probed
+        :type ports: list
         :param delay: the time in seconds that a TCP socket waits until timeout
         :type delay: int
         :param message: the message that is going to be included in the scanning packets,
         in order to prevent ethical problem, default to ''.
         :type message: str
-        :return: a dict that stores result in {port, status} style pairs.
-        status can be 'OPEN' or 'CLOSE'.
+        :param deadline: the time in seconds after which unresolved ports are given up on
+        :type deadline: float
+        :return: a generator of (port, status, rtt, errno, service) tuples.
+        :rtype: generator
         """
-        output = {}
+        timing = self.__new_timing(delay)
+        gate = self.__new_gate(self.__new_bucket(self.__rate_limit), self.__new_window())
+        workers = max(1, min(self.__worker_limit(None), self.__host_limit or self.__thread_limit, len(ports)))
+        stop_time = time.monotonic() + deadline
 
-        thread = threading.Thread(target=self.__scan_ports_helper, args=(ip, delay, output, message))
-        thread.start()
+        # Threads pull ports from a shared iterator, so that a large port set is never expanded.
+        ports = self.__iterate_ports(ports)
+        lock = threading.Lock()
+        stopped = threading.Event()
+        in_flight = set()
+        results = queue.Queue()
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        port_number = None if stopped.is_set() else next(ports, None)
+                        if port_number is None:
+                            return
+                        in_flight.add(port_number)
+
+                    try:
+                        status, rtt, err, service = self.__TCP_probe(ip, port_number, timing, gate, message, UDP_socks)
+                    except Exception:
+                        # A probe that raised could not tell anything about the port.
+                        status, rtt, err, service = PortStatus.FILTERED, None, 0, None
+
+                    with lock:
+                        if stopped.is_set():
+                            return
+                        in_flight.discard(port_number)
+                        results.put((port_number, status, rtt, err, service))
+            finally:
+                results.put(None)
+
+        UDP_socks, prober = self.__open_probe_sockets(message)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for _ in range(workers):
+                executor.submit(worker)
+
+            running = workers
+            while running:
+                try:
+                    result = results.get(timeout=max(0, stop_time - time.monotonic()))
+                except queue.Empty:
+                    break
+                if result is None:
+                    running -= 1
+                else:
+                    yield result
+
+            else:
+                return
+
+            # The deadline has passed, stop the workers and give up on every unresolved port.
+            with lock:
+                stopped.set()
+                unresolved = list(in_flight)
+            while not results.empty():
+                result = results.get_nowait()
+                if result is not None:
+                    yield result
+            # They are reported with ECANCELED, which tells them apart from the probes that timed out.
+            for port_number in unresolved:
+                yield port_number, PortStatus.FILTERED, None, errno.ECANCELED, None
+            for port_number in ports:
+                yield port_number, PortStatus.FILTERED, None, errno.ECANCELED, None
+
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            # Workers still in flight after the deadline fail to send on the closed sockets, which is ignored.
+            self.__close_probe_sockets(UDP_socks, prober)
+
+    def __new_rng(self):
+        """
+        Create the source of randomness of the order of the probes of a scan.
+
+        :return: a random.Random, or None if the ports are probed in order.
+        :rtype: random.Random
+        """
+        return random.Random(self.__seed) if self.__randomize else None
+
+    def __iterate_ports(self, ports):
+        """
+        :param ports: the list of ports that is going to be probed
+        :type ports: list
+        :return: an iterator over the ports, in a random order if set_randomize() has been enabled.
+        :rtype: iterator
+        """
+        rng = self.__new_rng()
+        return iter(ports) if rng is None else shuffled(ports, rng)
+
+    def __new_timing(self, delay):
+        """
+        Create the timeout estimator of a host.
+
+        :param delay: the time in seconds that a TCP socket waits until timeout
+        :type delay: float
+        :rtype: TimeoutEstimator
+        """
+        return TimeoutEstimator(delay, self.__adaptive_timeout, self.__min_delay, self.__max_delay)
+
+    @staticmethod
+    def __new_bucket(rate):
+        """
+        Create a token bucket for the given rate.
+
+        :param rate: the maximum number of probes per second, or None for no limit
+        :type rate: float
+        :return: the token bucket, or None if the rate is unlimited.
+        :rtype: TokenBucket
+        """
+        return None if rate is None else TokenBucket(rate)
+
+    def __new_window(self):
+        """
+        Create the congestion window of a scan.
+
+        :return: the congestion window, or None if the congestion control is disabled.
+        :rtype: CongestionWindow
+        """
+        return CongestionWindow(self.__thread_limit) if self.__congestion_control else None
+
+    def __worker_limit(self, prober):
+        """
+        Count the connects the asyncio engine can keep in flight, each of which holds a file descriptor. The
+        soft limit of open files is raised up to the hard limit if self.__thread_limit needs more, and the
+        workers are capped to the file descriptors that are still available.
+
+        :param prober: the SYN or UDP prober if the 'syn' or 'udp' engine is used, or None
+        :type prober: SynProber or UdpProber
+        :return: the number of workers of the scan.
+        :rtype: int
+        """
+        if prober is not None or resource is None:
+            # The SYN and UDP probers share a few sockets, whatever the number of probes in flight.
+            return self.__thread_limit
+
+        try:
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            in_use = len(os.listdir('/proc/self/fd' if os.path.isdir('/proc/self/fd') else '/dev/fd'))
+        except (OSError, ValueError):
+            return self.__thread_limit
+
+        needed = in_use + self.__thread_limit + self.__fd_reserve
+        if soft != resource.RLIM_INFINITY and soft < needed:
+            wanted = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+                soft = wanted
+            except (OSError, ValueError):
+                # macOS refuses limits above OPEN_MAX even below the hard limit.
+                pass
+        if soft == resource.RLIM_INFINITY or soft >= needed:
+            return self.__thread_limit
+
+        workers = max(1, soft - in_use - self.__fd_reserve)
+        self.__logger.warning(
+            'Only {} connects can be in flight under the open file limit of {}, instead of {}.'.format(
+                workers, soft, self.__thread_limit
+            )
+        )
+        return workers
+
+    def __new_gate(self, global_bucket, window):
+        """
+        Create the admission control of a host from the shared global token bucket and congestion window,
+        adding a token bucket of its own if a per host rate limit is set.
+
+        :param global_bucket: the token bucket shared by all hosts, or None
+        :type global_bucket: TokenBucket
+        :param window: the congestion window shared by all hosts, or None
+        :type window: CongestionWindow
+        :return: the admission control of the host, or None if probes are not throttled at all.
+        :rtype: ProbeGate
+        """
+        buckets = [bucket for bucket in (global_bucket, self.__new_bucket(self.__host_rate_limit)) if bucket]
+        if not buckets and window is None:
+            return None
+        return ProbeGate(buckets, window)
+
+    def __get_scan_deadline(self, delay, port_count, hosts=1):
+        """
+        Return the overall deadline of a scan. If no deadline has been set, it is derived from the
+        worst case in which every round of probes in flight times out on both the connect and the
+        message sending, and on the service detection if it is enabled, on top of the time the rate limits
+        need to send every probe.
+
+        :param delay: the time in seconds that a TCP socket waits until timeout
+        :type delay: int
+        :param port_count: the number of ports that is going to be probed
+        :type port_count: int
+        :param hosts: the number of hosts scanned at the same time, which share the thread limit and the
+        global rate limit, default to 1.
+        :type hosts: int
+        :return: the deadline of a scan in seconds.
+        :rtype: float
+        """
+        if self.__scan_deadline is not None:
+            return self.__scan_deadline
+
+        # The congestion window may shrink down to a single probe in flight.
+        in_flight = 1 if self.__congestion_control else max(1, self.__thread_limit // hosts)
+        if self.__host_limit is not None:
+            in_flight = min(in_flight, self.__host_limit)
+        rounds = -(-port_count // in_flight)
+        deadline = (rounds * 2 + 1) * delay
+        if self.__service_detection:
+            deadline += rounds * 2 * self.__banner_timeout
+
+        rates = [rate for rate in (self.__rate_limit and self.__rate_limit / hosts, self.__host_rate_limit) if rate]
+        if rates:
+            deadline += port_count / min(rates)
+        return deadline
+
+    def __scan_ports(self, host_name, ip, delay, message):
+        """
+        Controller of the __probe_ports() function
+
+        :param host_name: the hostname that is being scanned
+        :type host_name: str
+        :param ip: the ip address that is being scanned
+        :type ip: str
+        :param delay: the time in seconds that a TCP socket waits until timeout
+        :type delay: int
+        :param message: the message that is going to be included in the scanning packets,
+        in order to prevent ethical problem, default to ''.
+        :type message: str
+        :return: the scan results of the host.
+        :rtype: ScanResult
+        """
+        # Sharded scans are checkpointed by each of their processes.
+        checkpoint = self.__open_checkpoint() if self.__processes == 1 else None
+        try:
+            if checkpoint is None:
+                output, ports = ScanResult(host_name, ip), self.target_ports
+            else:
+                output, ports = checkpoint.restore(host_name, ip, self.target_ports)
+
+            results = self.__probe_ports(ip, ports, delay, message)
+            for port_number, status, rtt, err, service in self.__observe(host_name, ip, ports, results):
+                output.add(port_number, status, rtt, err, service)
+                # Ports given up on at the deadline have not been probed, a resumed scan probes them again.
+                if checkpoint is not None and err != errno.ECANCELED:
+                    checkpoint.record(host_name, ip, port_number, status, rtt, err, service)
 
-        # Wait until all ports being scanned
-        while len(output) < len(self.target_ports):
-            time.sleep(0.01)
-            continue
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
 
         # Print opening ports from small to large
-        for port in self.target_ports:
-            if output[port] == 'OPEN':
-                print('{}: {}\n'.format(port, output[port]))
+        for port in sorted(output.open_ports()):
+            self.__logger.info('{}: {}\n'.format(port, output[port]))
 
         return output
 
-    def __TCP_connect(self, ip, port_number, delay, output, message):
+    def __TCP_probe(self, ip, port_number, timing, gate, message, UDP_socks):
+        """
+        Admit a probe through the admission control of its host and perform it with __TCP_connect().
+
+        :param gate: the admission control of the host, or None
+        :type gate: ProbeGate
+        :param UDP_socks: the shared UDP sockets used to send the scanning alert message, keyed by address family.
+        :type UDP_socks: dict
+        :return: status of the port, round trip time, errno and service of the handshake, see __TCP_connect().
+        :rtype: tuple
+        """
+        if gate is not None:
+            gate.enter()
+
+        UDP_sock = UDP_socks.get(self.__family(ip))
+        if UDP_sock is not None:
+            try:
+                UDP_sock.sendto(message, (ip, int(port_number)))
+            except socket.error:
+                pass
+
+        metrics = self.__metrics
+        if metrics is not None:
+            metrics.probe_sent()
+
+        rtt = None
+        try:
+            status, rtt, err, service = self.__TCP_connect(ip, port_number, timing, message)
+            return status, rtt, err, service
+        finally:
+            if metrics is not None:
+                metrics.probe_returned()
+            if gate is not None:
+                gate.leave(rtt is not None)
+
+    def __TCP_connect(self, ip, port_number, timing, message):
         """
         Perform status checking for a given port on a given ip address using TCP handshake
 
@@ -245,46 +1571,406 @@ class PortScanner:
         :type ip: str
         :param port_number: the port that is going to be checked
         :type port_number: int
+        :param timing: the timeout estimator of the host, fed with the measured round trip time
+        :type timing: TimeoutEstimator
+        :param message: the message that is going to be included in the scanning packets,
+        in order to prevent ethical problem, default to ''.
+        :type message: str
+        :return: status of the port, the round trip time in seconds of the handshake, or None if no
+        reply was received, the errno the handshake failed with, 0 if none, and the service detected on
+        the port, or None.
+        :rtype: tuple
+        """
+        TCP_sock = None
+        try:
+            # Initialize the TCP socket object, the socket option is chosen once per platform.
+            TCP_sock = socket.socket(self.__family(ip), socket.SOCK_STREAM)
+            TCP_sock.setsockopt(socket.SOL_SOCKET, self.__reuse_option, 1)
+            TCP_sock.settimeout(timing.timeout())
+
+            start_time = time.monotonic()
+            result = TCP_sock.connect_ex((ip, int(port_number)))
+            rtt = None
+            if result == 0 or result == errno.ECONNREFUSED:
+                # Only accepted or refused connects tell us the round trip time to the host.
+                rtt = time.monotonic() - start_time
+                timing.update(rtt)
+            elif result == errno.ECONNRESET:
+                # The service accepted the connection and reset it before the connect was seen to complete,
+                # only an established connection can be reset.
+                return PortStatus.OPEN, time.monotonic() - start_time, 0, None
+            service = None
+            if result == 0 and self.__service_detection:
+                # The service is detected before the message is sent, which it would not know how to parse.
+                service = self.__detect_service(TCP_sock, port_number)
+            if result == 0 and message != b'':
+                self.__send_message(TCP_sock, message)
+
+            # If the TCP handshake is successful, the port is OPEN. If the host refused it, it is CLOSED.
+            # Otherwise no answer came back from the host and it is FILTERED.
+            if result == 0:
+                return PortStatus.OPEN, rtt, 0, service
+            elif result == errno.ECONNREFUSED:
+                return PortStatus.CLOSED, rtt, result, None
+            elif result in (errno.EAGAIN, errno.EWOULDBLOCK):
+                # connect_ex() reports a timeout as EAGAIN
+                return PortStatus.FILTERED, None, errno.ETIMEDOUT, None
+            else:
+                return PortStatus.FILTERED, None, result, None
+
+        except socket.timeout:
+            return PortStatus.FILTERED, None, errno.ETIMEDOUT, None
+
+        except socket.error as e:
+            # Failed to perform a TCP handshake, the port is probably filtered.
+            return PortStatus.FILTERED, None, e.errno or 0, None
+
+        finally:
+            if TCP_sock is not None:
+                TCP_sock.close()
+
+    @staticmethod
+    def __send_message(TCP_sock, message):
+        """
+        Send the scanning alert message on a connected socket. The handshake has already succeeded, so the
+        port is OPEN whether the message goes through or the service resets the connection first.
+
+        :param TCP_sock: the connected socket
+        :type TCP_sock: socket.socket
+        :param message: the message that is going to be included in the scanning packets
+        :type message: bytes
+        """
+        try:
+            TCP_sock.sendall(message)
+        except socket.error:
+            pass
+
+    def __detect_service(self, TCP_sock, port_number):
+        """
+        Detect the service of an open port on its connected socket. The banner the service greets with is
+        read first, and if none comes within the banner timeout, the probe of the port is sent and its reply
+        is read instead.
+
+        :param TCP_sock: the connected socket
+        :type TCP_sock: socket.socket
+        :param port_number: the open port
+        :type port_number: int
+        :return: the name of the service, or None if it did not answer, see services.identify().
+        :rtype: str
+        """
+        TCP_sock.settimeout(self.__banner_timeout)
+        try:
+            data = TCP_sock.recv(services.BANNER_SIZE)
+        except socket.timeout:
+            # The service waits for the client to speak first.
+            try:
+                TCP_sock.sendall(services.probe_for(port_number))
+                data = TCP_sock.recv(services.BANNER_SIZE)
+            except socket.error:
+                return None
+        except socket.error:
+            return None
+        return services.identify(data)
+
+    async def __probe_ports_async(self, ip, ports, delay, message, deadline):
+        """
+        Probe ports on a single event loop. A fixed pool of workers pulls ports from a shared iterator,
+        so at most self.__thread_limit connects are in flight at any time. Results are yielded as soon as
+        each probe resolves, and every probe still unresolved when the deadline passes is given up on.
+
+        :param ip: the ip address that is being scanned
+        :type ip: str
+        :param ports: the list of ports that is going to be probed
+        :type ports: list
         :param delay: the time in seconds that a TCP socket waits until timeout
         :type delay: int
-        :param output: a dict that stores result in {port, status} style pairs.
-        status can be 'OPEN' or 'CLOSE'.
-        :type output: dict
         :param message: the message that is going to be included in the scanning packets,
         in order to prevent ethical problem, default to ''.
         :type message: str
+        :param deadline: the time in seconds after which unresolved ports are given up on
+        :type deadline: float
+        :return: an async generator of (port, status, rtt, errno, service) tuples.
         """
-        # Initialize the TCP socket object based on different operating systems.
-        # All systems except for 'Windows' will be treated equally.
-        curr_os = platform.system()
-        if curr_os == 'Windows':
-            TCP_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            TCP_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            TCP_sock.settimeout(delay)
-        else:
-            TCP_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            TCP_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-            TCP_sock.settimeout(delay)
+        loop = asyncio.get_running_loop()
+        stop_time = loop.time() + deadline
+        timing = self.__new_timing(delay)
+        gate = self.__new_gate(self.__new_bucket(self.__rate_limit), self.__new_window())
+        port_count = len(ports)
+        ports = self.__iterate_ports(ports)
+        in_flight = set()
+        results = asyncio.Queue()
 
-        # Initialize a UDP socket to send scanning alert message if there exists an non-empty message
-        if message != '':
-            UDP_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            UDP_sock.sendto(message, (ip, int(port_number)))
+        UDP_socks, prober = self.__open_probe_sockets(message)
 
+        async def worker():
+            for port_number in ports:
+                in_flight.add(port_number)
+                status, rtt, err, service = await self.__TCP_probe_async(
+                    ip, port_number, timing, gate, message, UDP_socks, prober
+                )
+                in_flight.discard(port_number)
+                results.put_nowait((port_number, status, rtt, err, service))
+
+        async def run():
+            try:
+                workers = min(
+                    self.__worker_limit(prober), self.__host_limit or self.__thread_limit, port_count
+                )
+                await asyncio.gather(*[worker() for _ in range(workers)])
+            finally:
+                results.put_nowait(None)
+
+        runner = asyncio.ensure_future(run())
         try:
-            result = TCP_sock.connect_ex((ip, int(port_number)))
-            if message != '':
-                TCP_sock.sendall(message)
+            while True:
+                try:
+                    result = await asyncio.wait_for(results.get(), max(0, stop_time - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if result is None:
+                    await runner
+                    return
+                yield result
 
-            # If the TCP handshake is successful, the port is OPEN. Otherwise it is CLOSE
-            if result == 0:
-                output[port_number] = 'OPEN'
-            else:
-                output[port_number] = 'CLOSE'
+            # The deadline has passed, stop the workers and give up on every unresolved port.
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+            while not results.empty():
+                result = results.get_nowait()
+                if result is not None:
+                    yield result
+            for port_number in list(in_flight) + list(ports):
+                yield port_number, PortStatus.FILTERED, None, errno.ECANCELED, None
+
+        finally:
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+            self.__close_probe_sockets(UDP_socks, prober)
 
-            TCP_sock.close()
+    def __open_probe_sockets(self, message):
+        """
+        Open the sockets shared by all probes of a scan: a UDP socket per address family to send the scanning
+        alert message, and the sockets of the SYN or UDP prober if the 'syn' or 'udp' engine is used. The UDP
+        prober sends the message itself, as the payload of the probes.
+
+        :param message: the message that is going to be included in the scanning packets,
+        in order to prevent ethical problem, default to ''.
+        :type message: str
+        :return: a dict in the form of {address_family: UDP socket}, empty if there is no message, and the
+        SYN or UDP prober, or None.
+        :rtype: tuple
+        """
+        UDP_socks = {}
+        if message != b'' and self.__engine != 'udp':
+            for family in (socket.AF_INET, socket.AF_INET6):
+                try:
+                    UDP_socks[family] = socket.socket(family, socket.SOCK_DGRAM)
+                    UDP_socks[family].setblocking(False)
+                except socket.error:
+                    # The host does not support this address family.
+                    pass
+
+        prober = None
+        if self.__engine in ('syn', 'udp'):
+            prober = synscan.SynProber() if self.__engine == 'syn' else udpscan.UdpProber(message)
+            try:
+                prober.open()
+            except BaseException:
+                self.__close_probe_sockets(UDP_socks, None)
+                raise
+
+        return UDP_socks, prober
+
+    @staticmethod
+    def __close_probe_sockets(UDP_socks, prober):
+        """
+        Close the sockets opened by __open_probe_sockets().
+        """
+        for UDP_sock in UDP_socks.values():
+            UDP_sock.close()
+        if prober is not None:
+            prober.close()
+
+    @staticmethod
+    def __family(ip):
+        """
+        :param ip: an ip address
+        :type ip: str
+        :return: the address family of the ip address, socket.AF_INET or socket.AF_INET6.
+        :rtype: int
+        """
+        return socket.AF_INET6 if ':' in ip else socket.AF_INET
+
+    async def __TCP_probe_async(self, ip, port_number, timing, gate, message, UDP_socks, prober):
+        """
+        Admit a probe through the admission control of its host and perform it, either with
+        __TCP_connect_async() or with the SYN or UDP prober.
+
+        :param gate: the admission control of the host, or None
+        :type gate: ProbeGate
+        :param UDP_socks: the shared UDP sockets used to send the scanning alert message, keyed by address family.
+        :type UDP_socks: dict
+        :param prober: the SYN or UDP prober if the 'syn' or 'udp' engine is used, or None
+        :type prober: SynProber or UdpProber
+        :return: status of the port, round trip time, errno and service of the probe, see __TCP_connect_async().
+        :rtype: tuple
+        """
+        if gate is not None:
+            await gate.enter_async()
+
+        UDP_sock = UDP_socks.get(self.__family(ip))
+        if UDP_sock is not None:
+            try:
+                UDP_sock.sendto(message, (ip, int(port_number)))
+            except socket.error:
+                pass
+
+        metrics = self.__metrics
+        if metrics is not None:
+            metrics.probe_sent()
+
+        # None until the probe returns, a probe cancelled at the deadline neither grows nor shrinks the window.
+        answered = None
+        try:
+            if prober is not None:
+                # A half-open or UDP probe never connects to the service, so it cannot be detected.
+                status, rtt, err = await prober.probe(ip, port_number, timing)
+                answered = rtt is not None
+                return status, rtt, err, None
+            status, rtt, err, service = await self.__TCP_connect_async(ip, port_number, timing, message)
+            answered = rtt is not None
+            return status, rtt, err, service
+        finally:
+            if metrics is not None:
+                metrics.probe_returned()
+            if gate is not None:
+                gate.leave_async(answered)
+
+    async def __TCP_connect_async(self, ip, port_number, timing, message):
+        """
+        Perform status checking for a given port on a given ip address using a non-blocking TCP handshake
+
+        :param ip: the ip address that is being scanned
+        :type ip: str
+        :param port_number: the port that is going to be checked
+        :type port_number: int
+        :param timing: the timeout estimator of the host, fed with the measured round trip time
+        :type timing: TimeoutEstimator
+        :param message: the message that is going to be included in the scanning packets,
+        in order to prevent ethical problem, default to ''.
+        :type message: str
+        :return: status of the port, the round trip time in seconds of the handshake, or None if no
+        reply was received, the errno the handshake failed with, 0 if none, and the service detected on
+        the port, or None.
+        :rtype: tuple
+        """
+        loop = asyncio.get_running_loop()
+
+        TCP_sock = None
+        delay = timing.timeout()
+        try:
+            TCP_sock = await self.__new_socket_async(self.__family(ip))
+            start_time = loop.time()
+            await asyncio.wait_for(loop.sock_connect(TCP_sock, (ip, int(port_number))), delay)
+            rtt = loop.time() - start_time
+            timing.update(rtt)
+            service = None
+            if self.__service_detection:
+                service = await self.__detect_service_async(TCP_sock, port_number)
+            if message != b'':
+                await self.__send_message_async(TCP_sock, message, delay)
+            return PortStatus.OPEN, rtt, 0, service
+
+        except ConnectionRefusedError:
+            # A refused connect still tells us the round trip time to the host.
+            rtt = loop.time() - start_time
+            timing.update(rtt)
+            return PortStatus.CLOSED, rtt, errno.ECONNREFUSED, None
+
+        except ConnectionResetError:
+            # The service accepted the connection and reset it before the connect was seen to complete,
+            # only an established connection can be reset.
+            rtt = loop.time() - start_time
+            return PortStatus.OPEN, rtt, 0, None
+
+        except asyncio.TimeoutError:
+            return PortStatus.FILTERED, None, errno.ETIMEDOUT, None
 
         except socket.error as e:
-            # Failed to perform a TCP handshake means the port is probably close.
-            output[port_number] = 'CLOSE'
+            # Failed to perform a TCP handshake, the port is probably filtered.
+            return PortStatus.FILTERED, None, e.errno or 0, None
+
+        finally:
+            if TCP_sock is not None:
+                TCP_sock.close()
+                self.__sockets_open -= 1
+
+    async def __new_socket_async(self, family):
+        """
+        Open a non-blocking TCP socket. Running out of file descriptors is back-pressure rather than
+        a probe failure: the socket is opened again once a connect in flight has released its own, and
+        the error is only raised if no connect is in flight to release one.
+
+        :param family: the address family, socket.AF_INET or socket.AF_INET6
+        :type family: int
+        :return: the socket.
+        :rtype: socket.socket
+        """
+        pause = 0.001
+        while True:
+            try:
+                TCP_sock = socket.socket(family, socket.SOCK_STREAM)
+                break
+            except OSError as e:
+                if e.errno not in (errno.EMFILE, errno.ENFILE) or not self.__sockets_open:
+                    raise
+            await asyncio.sleep(pause)
+            pause = min(pause * 2, 0.05)
+        TCP_sock.setblocking(False)
+        self.__sockets_open += 1
+        return TCP_sock
+
+    @staticmethod
+    async def __send_message_async(TCP_sock, message, delay):
+        """
+        The non-blocking version of __send_message().
+
+        :param TCP_sock: the connected non-blocking socket
+        :type TCP_sock: socket.socket
+        :param message: the message that is going to be included in the scanning packets
+        :type message: bytes
+        :param delay: the time in seconds the message may take to be sent
+        :type delay: float
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(loop.sock_sendall(TCP_sock, message), delay)
+        except (asyncio.TimeoutError, socket.error):
             pass
+
+    async def __detect_service_async(self, TCP_sock, port_number):
+        """
+        The non-blocking version of __detect_service().
+
+        :param TCP_sock: the connected non-blocking socket
+        :type TCP_sock: socket.socket
+        :param port_number: the open port
+        :type port_number: int
+        :return: the name of the service, or None if it did not answer, see services.identify().
+        :rtype: str
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            data = await asyncio.wait_for(loop.sock_recv(TCP_sock, services.BANNER_SIZE), self.__banner_timeout)
+        except asyncio.TimeoutError:
+            # The service waits for the client to speak first.
+            try:
+                await asyncio.wait_for(
+                    loop.sock_sendall(TCP_sock, services.probe_for(port_number)), self.__banner_timeout
+                )
+                data = await asyncio.wait_for(loop.sock_recv(TCP_sock, services.BANNER_SIZE), self.__banner_timeout)
+            except (asyncio.TimeoutError, socket.error):
+                return None
+        except socket.error:
+            return None
+        return services.identify(data)
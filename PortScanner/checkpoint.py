@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the scan checkpoint. Every finished probe is appended to a JSON Lines file as the scan
+goes, so that a crashed or interrupted sweep can be resumed by probing only the ports that are not recorded
+yet. Lines are written with a single append each, so several scanning processes can share one file.
+"""
+
+import json
+import os
+import time
+
+from results import PortStatus, ScanResult
+
+
+class Checkpoint:
+    """
+    An append-only log of finished probes, one JSON object per line in the form of
+    {"host": "example.com", "ip": "93.184.216.34", "port": 80, "status": "OPEN", "rtt": 0.02, "errno": 0},
+    with a "service" key added when a service has been detected on the port.
+    Probes are recorded by ip address, so a resumed scan reuses them whatever host name resolved to it.
+    """
+
+    def __init__(self, path, flush_size=512, flush_interval=1.0):
+        """
+        Open the checkpoint file, creating it if needed, and load the probes it already records.
+
+        :param path: the path of the checkpoint file
+        :type path: str
+        :param flush_size: the number of buffered probes that triggers a write
+        :type flush_size: int
+        :param flush_interval: the maximum time in seconds a probe stays buffered
+        :type flush_interval: float
+        """
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.__buffer = []
+        self.__last_flush = time.monotonic()
+
+        self.__fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # ip -> ScanResult of the probes recorded in the file
+        self.__recorded, truncated = self.__load(path)
+        if truncated:
+            # The last line has been cut short by a crash, do not glue the next record to it.
+            self.__buffer.append('\n')
+
+    @staticmethod
+    def discard(path):
+        """
+        Empty the checkpoint file at the given path, if there is one.
+
+        :param path: the path of the checkpoint file
+        :type path: str
+        """
+        if os.path.exists(path):
+            open(path, 'w').close()
+
+    @staticmethod
+    def read(path):
+        """
+        Read the probes recorded in a checkpoint file without opening it for writing.
+
+        :param path: the path of the checkpoint file
+        :type path: str
+        :return: a dict in the form of {ip: ScanResult}, empty if there is no such file.
+        :rtype: dict
+        """
+        if not os.path.exists(path):
+            return {}
+        return Checkpoint.__load(path)[0]
+
+    @staticmethod
+    def __load(path):
+        """
+        Load every probe recorded in a checkpoint file. Lines that cannot be parsed are skipped, and a port
+        recorded several times, for example by a rescan, keeps only its last record.
+
+        :param path: the path of the checkpoint file
+        :type path: str
+        :return: a dict in the form of {ip: ScanResult} of the recorded probes, and whether the file does not
+        end with a complete line.
+        :rtype: tuple
+        """
+        recorded = {}
+        truncated = False
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                truncated = not line.endswith('\n')
+                try:
+                    record = json.loads(line)
+                    output = recorded.get(record['ip'])
+                    if output is None:
+                        output = recorded[record['ip']] = ScanResult(record['host'], record['ip'])
+                    output.add(
+                        record['port'], PortStatus[record['status']], record['rtt'], record['errno'],
+                        record.get('service')
+                    )
+                except (ValueError, KeyError, TypeError):
+                    continue
+        for ip, output in recorded.items():
+            if len(set(output)) < len(output):
+                recorded[ip] = Checkpoint.__latest(output)
+        return recorded, truncated
+
+    @staticmethod
+    def __latest(output):
+        """
+        :param output: the recorded probes of a host, some ports being recorded several times
+        :type output: ScanResult
+        :return: a ScanResult with the last probe of each port, in the order in which ports were first recorded.
+        :rtype: ScanResult
+        """
+        latest = ScanResult(output.host, output.ip)
+        for port in dict.fromkeys(output):
+            latest.add(port, output.status(port), output.rtt(port), output.errno(port), output.service(port))
+        return latest
+
+    def restore(self, host, ip, ports):
+        """
+        Split the given ports of a host into the ones recorded in the checkpoint and the ones that are
+        still to be probed.
+
+        :param host: the host name (or address) that is being scanned
+        :type host: str
+        :param ip: the ip address that is being scanned
+        :type ip: str
+        :param ports: the list of ports that is going to be scanned
+        :type ports: list
+        :return: a ScanResult filled with the recorded probes and the list of remaining ports.
+        :rtype: tuple
+        """
+        output = ScanResult(host, ip)
+        recorded = self.__recorded.get(ip)
+        if recorded is None:
+            return output, ports
+
+        wanted = set(ports)
+        for port, status, rtt, errno in recorded.records():
+            if port in wanted:
+                wanted.discard(port)
+                output.add(port, status, rtt, errno, recorded.service(port))
+        return output, [port for port in ports if port in wanted]
+
+    def record(self, host, ip, port, status, rtt, errno, service=None):
+        """
+        Append one finished probe to the checkpoint.
+
+        :param host: the host name (or address) that has been scanned
+        :type host: str
+        :param ip: the ip address that has been scanned
+        :type ip: str
+        :param port: the port that has been checked
+        :type port: int
+        :param status: the status of the port
+        :type status: PortStatus
+        :param rtt: the round trip time of the probe in seconds, or None if no reply was received
+        :type rtt: float
+        :param errno: the errno the probe failed with, 0 if none
+        :type errno: int
+        :param service: the name of the service detected on the port, or None if none was detected
+        :type service: str
+        """
+        record = {
+            'host': host, 'ip': ip, 'port': int(port), 'status': PortStatus(status).name, 'rtt': rtt, 'errno': errno
+        }
+        if service is not None:
+            record['service'] = service
+        self.__buffer.append(json.dumps(record, separators=(',', ':')) + '\n')
+        if len(self.__buffer) >= self.flush_size or time.monotonic() - self.__last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered probes to the file.
+        """
+        if self.__buffer:
+            os.write(self.__fd, ''.join(self.__buffer).encode('utf-8'))
+            self.__buffer = []
+        self.__last_flush = time.monotonic()
+
+    def close(self):
+        """
+        Write the buffered probes and close the file.
+        """
+        if self.__fd is None:
+            return
+        try:
+            self.flush()
+        finally:
+            os.close(self.__fd)
+            self.__fd = None
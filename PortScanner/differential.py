@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the differential rescan helpers. Instead of probing every port again, a rescan probes the
+ports that were open in a previous snapshot of a host plus a rotating sample of the other ports, and reports
+only the ports whose state changed. Successive rescans rotate through the whole port list.
+"""
+
+import time
+
+from checkpoint import Checkpoint
+from results import PortStatus, ScanResult
+
+
+def load(snapshot):
+    """
+    Index a previous snapshot by ip address.
+
+    :param snapshot: the ScanResults of a previous scan, such as the outputs of scan() or scan_many(), or the
+    path of a checkpoint file written by a previous scan
+    :type snapshot: iterable or str
+    :return: a dict in the form of {ip: ScanResult}.
+    :rtype: dict
+    """
+    if isinstance(snapshot, str):
+        return Checkpoint.read(snapshot)
+    if isinstance(snapshot, ScanResult):
+        snapshot = [snapshot]
+    return {output.ip: output for output in snapshot if output.ip is not None}
+
+
+def plan(previous, ports, sample, rotation=None):
+    """
+    Choose and order the ports to be probed on a host. The ports open in the previous snapshot come first,
+    followed by one slice out of every 1 / sample of the other ports, chosen by the rotation.
+
+    :param previous: the previous results of the host, or None if it has never been scanned
+    :type previous: ScanResult
+    :param ports: the list of ports that is going to be scanned
+    :type ports: list
+    :param sample: the fraction of the other ports probed, between 0 and 1
+    :type sample: float
+    :param rotation: the index of the slice probed, default to the number of days since the epoch, so that a
+    nightly rescan covers every port once every 1 / sample nights
+    :type rotation: int
+    :return: the ports to be probed, in order.
+    :rtype: list
+    """
+    if previous is None:
+        return ports
+
+    if rotation is None:
+        rotation = int(time.time() // 86400)
+    slices = max(1, int(round(1 / sample))) if sample > 0 else 0
+
+    opened = set(previous.open_ports())
+    head = [port for port in ports if port in opened]
+    if not slices:
+        return head
+    tail = [port for index, port in enumerate(ports) if port not in opened and index % slices == rotation % slices]
+    return head + tail
+
+
+def changes(previous, current):
+    """
+    Compare the new results of a host with its previous snapshot.
+
+    :param previous: the previous results of the host, or None if it has never been scanned
+    :type previous: ScanResult
+    :param current: the new results of the host
+    :type current: ScanResult
+    :return: a list of (port, before, after) tuples, sorted by port, for every port that has been opened
+    or closed, in which before is the previous PortStatus, or None if the port has never been probed, and
+    after is the new PortStatus.
+    :rtype: list
+    """
+    output = []
+    for port, status, rtt, errno in current.records():
+        before = None
+        if previous is not None and port in previous:
+            before = previous.status(port)
+        if (before == PortStatus.OPEN) != (status == PortStatus.OPEN):
+            output.append((port, before, status))
+    return sorted(output)
+
+
+def merge(previous, current):
+    """
+    Update the previous snapshot of a host with its new results, to be used as the snapshot of the
+    next rescan.
+
+    :param previous: the previous results of the host, or None if it has never been scanned
+    :type previous: ScanResult
+    :param current: the new results of the host
+    :type current: ScanResult
+    :return: the results of every port, new or previous.
+    :rtype: ScanResult
+    """
+    if previous is None:
+        return current
+
+    probed = {record[0]: record + (current.service(record[0]),) for record in current.records()}
+    output = ScanResult(current.host, current.ip)
+    for record in previous.records():
+        output.add(*probed.pop(record[0], record + (previous.service(record[0]),)))
+    for record in probed.values():
+        output.add(*record)
+    return output
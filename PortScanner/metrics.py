@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the scan instrumentation. A ScanMetrics object attached to a scanner counts probes as they
+are sent and as they finish, and exposes the number of probes in flight, the probe rate, the timeout rate,
+a histogram of round trip times and the progress of every host being scanned. The values can be read
+directly, pushed to callbacks, or exported in the Prometheus text format.
+"""
+
+import bisect
+import errno
+import http.server
+import threading
+import time
+
+from results import PortStatus
+
+# upper bounds in seconds of the round trip time histogram buckets
+RTT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ScanMetrics:
+    """
+    Thread safe counters of the probes of one or many scans.
+    """
+
+    def __init__(self, on_probe=None, on_host=None, rate_window=10):
+        """
+        :param on_probe: a function called with (host, ip, port, status, rtt, errno) whenever a probe finishes
+        :type on_probe: function
+        :param on_host: a function called with (host, ip, output) whenever a host is completely scanned, in
+        which output is the ScanResult of the host
+        :type on_host: function
+        :param rate_window: the number of seconds the probe rate is averaged over
+        :type rate_window: int
+        """
+        self.on_probe = on_probe
+        self.on_host = on_host
+        self.__lock = threading.Lock()
+        self.__start_time = time.monotonic()
+
+        self.__in_flight = 0
+        self.__statuses = {status: 0 for status in PortStatus}
+        self.__timeouts = 0
+        self.__rtt_buckets = [0] * (len(RTT_BUCKETS) + 1)
+        self.__rtt_sum = 0.0
+        self.__rtt_count = 0
+        self.__hosts_completed = 0
+        # (host, ip) -> [probes finished, probes to be sent]
+        self.__progress = {}
+
+        # probes finished per second over the last rate_window seconds, as a ring of (second, count)
+        self.__rate_window = max(1, int(rate_window))
+        self.__rate_ring = [(0, 0)] * (self.__rate_window + 1)
+
+    def probe_sent(self):
+        """
+        Record that a probe has been admitted and sent.
+        """
+        with self.__lock:
+            self.__in_flight += 1
+
+    def probe_returned(self):
+        """
+        Record that a probe recorded by probe_sent() has returned, answered or not.
+        """
+        with self.__lock:
+            self.__in_flight -= 1
+
+    def host_started(self, host, ip, total):
+        """
+        Record that a host is going to be scanned.
+
+        :param host: the host name (or address) as given by the caller
+        :type host: str
+        :param ip: the ip address that is going to be scanned
+        :type ip: str
+        :param total: the number of ports that is going to be probed
+        :type total: int
+        """
+        with self.__lock:
+            self.__progress[(host, ip)] = [0, total]
+
+    def host_finished(self, host, ip, output=None):
+        """
+        Record that a host has been completely scanned.
+
+        :param host: the host name (or address) as given by the caller
+        :type host: str
+        :param ip: the ip address that has been scanned
+        :type ip: str
+        :param output: the results of the host
+        :type output: ScanResult
+        """
+        with self.__lock:
+            self.__progress.pop((host, ip), None)
+            self.__hosts_completed += 1
+        if self.on_host is not None:
+            self.on_host(host, ip, output)
+
+    def record(self, host, ip, port, status, rtt=None, err=0):
+        """
+        Record a finished probe.
+
+        :param host: the host name (or address) as given by the caller
+        :type host: str
+        :param ip: the ip address that has been scanned
+        :type ip: str
+        :param port: the port that has been checked
+        :type port: int
+        :param status: the status of the port
+        :type status: PortStatus
+        :param rtt: the round trip time of the probe in seconds, or None if no reply was received
+        :type rtt: float
+        :param err: the errno the probe failed with, 0 if none
+        :type err: int
+        """
+        second = int(time.monotonic())
+        with self.__lock:
+            self.__statuses[PortStatus(status)] += 1
+            # Probes given up on at the scan deadline (ECANCELED) count as timed out as well.
+            if err in (errno.ETIMEDOUT, errno.ECANCELED):
+                self.__timeouts += 1
+
+            if rtt is not None:
+                self.__rtt_buckets[bisect.bisect_left(RTT_BUCKETS, rtt)] += 1
+                self.__rtt_sum += rtt
+                self.__rtt_count += 1
+
+            progress = self.__progress.get((host, ip))
+            if progress is not None:
+                progress[0] += 1
+
+            slot = second % len(self.__rate_ring)
+            seen, count = self.__rate_ring[slot]
+            self.__rate_ring[slot] = (second, count + 1 if seen == second else 1)
+
+        if self.on_probe is not None:
+            self.on_probe(host, ip, port, status, rtt, err)
+
+    @property
+    def in_flight(self):
+        """
+        The number of probes sent and not returned yet.
+
+        :rtype: int
+        """
+        return self.__in_flight
+
+    @property
+    def probes(self):
+        """
+        The number of finished probes.
+
+        :rtype: int
+        """
+        return sum(self.__statuses.values())
+
+    def probes_per_second(self):
+        """
+        :return: the number of probes finished per second, averaged over the last rate_window complete seconds.
+        :rtype: float
+        """
+        now = int(time.monotonic())
+        window = min(self.__rate_window, max(1, now - int(self.__start_time)))
+        with self.__lock:
+            count = sum(c for second, c in self.__rate_ring if now - window <= second < now)
+        return count / float(window)
+
+    def timeout_rate(self):
+        """
+        :return: the fraction of finished probes that timed out.
+        :rtype: float
+        """
+        probes = self.probes
+        return self.__timeouts / float(probes) if probes else 0.0
+
+    def rtt_histogram(self):
+        """
+        :return: a list of (upper bound in seconds, count) pairs of the round trip times, not cumulative, the
+        last bound being infinity.
+        :rtype: list
+        """
+        with self.__lock:
+            return list(zip(RTT_BUCKETS + (float('inf'),), self.__rtt_buckets))
+
+    def progress(self):
+        """
+        :return: a dict in the form of {(host, ip): (probes finished, probes to be sent)} of the hosts being
+        scanned.
+        :rtype: dict
+        """
+        with self.__lock:
+            return {key: tuple(value) for key, value in self.__progress.items()}
+
+    def snapshot(self):
+        """
+        :return: every metric as a dict.
+        :rtype: dict
+        """
+        with self.__lock:
+            statuses = {status.name: count for status, count in self.__statuses.items()}
+            hosts_completed = self.__hosts_completed
+            rtt_sum, rtt_count = self.__rtt_sum, self.__rtt_count
+        return {
+            'in_flight': self.__in_flight,
+            'probes': statuses,
+            'probes_per_second': self.probes_per_second(),
+            'timeout_rate': self.timeout_rate(),
+            'rtt_histogram': self.rtt_histogram(),
+            'rtt_mean': rtt_sum / rtt_count if rtt_count else None,
+            'hosts_completed': hosts_completed,
+            'progress': self.progress(),
+        }
+
+    def prometheus(self):
+        """
+        Export the metrics in the Prometheus text exposition format.
+
+        :rtype: str
+        """
+        lines = [
+            '# HELP portscanner_probes_in_flight Probes sent and not returned yet.',
+            '# TYPE portscanner_probes_in_flight gauge',
+            'portscanner_probes_in_flight {}'.format(self.__in_flight),
+            '# HELP portscanner_probes_total Finished probes by port status.',
+            '# TYPE portscanner_probes_total counter',
+        ]
+        with self.__lock:
+            statuses = dict(self.__statuses)
+            timeouts = self.__timeouts
+            rtt_sum, rtt_count = self.__rtt_sum, self.__rtt_count
+            hosts_completed = self.__hosts_completed
+        for status, count in statuses.items():
+            lines.append('portscanner_probes_total{{status="{}"}} {}'.format(status.name.lower(), count))
+
+        lines += [
+            '# HELP portscanner_probe_timeouts_total Probes that timed out.',
+            '# TYPE portscanner_probe_timeouts_total counter',
+            'portscanner_probe_timeouts_total {}'.format(timeouts),
+            '# HELP portscanner_probes_per_second Probes finished per second.',
+            '# TYPE portscanner_probes_per_second gauge',
+            'portscanner_probes_per_second {}'.format(self.probes_per_second()),
+            '# HELP portscanner_probe_rtt_seconds Round trip time of answered probes.',
+            '# TYPE portscanner_probe_rtt_seconds histogram',
+        ]
+        cumulative = 0
+        for bound, count in self.rtt_histogram():
+            cumulative += count
+            lines.append('portscanner_probe_rtt_seconds_bucket{{le="{}"}} {}'.format(
+                '+Inf' if bound == float('inf') else bound, cumulative
+            ))
+        lines += [
+            'portscanner_probe_rtt_seconds_sum {}'.format(rtt_sum),
+            'portscanner_probe_rtt_seconds_count {}'.format(rtt_count),
+            '# HELP portscanner_hosts_completed_total Hosts completely scanned.',
+            '# TYPE portscanner_hosts_completed_total counter',
+            'portscanner_hosts_completed_total {}'.format(hosts_completed),
+            '# HELP portscanner_host_progress_ratio Fraction of the probes of a host that finished.',
+            '# TYPE portscanner_host_progress_ratio gauge',
+        ]
+        for (host, ip), (done, total) in sorted(self.progress().items(), key=lambda item: str(item[0])):
+            lines.append('portscanner_host_progress_ratio{{host="{}",ip="{}"}} {}'.format(
+                self.__escape(host), self.__escape(ip), done / float(total) if total else 1.0
+            ))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def __escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def serve(self, port, address='127.0.0.1'):
+        """
+        Serve the Prometheus export on http://address:port/metrics from a background thread.
+
+        :param port: the port to listen on, 0 to pick a free one
+        :type port: int
+        :param address: the address to listen on, default to the loopback interface
+        :type address: str
+        :return: the HTTP server, call its shutdown() method to stop it.
+        :rtype: http.server.HTTPServer
+        """
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((address, port), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
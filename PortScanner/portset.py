@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the port set. Ports are parsed from nmap style specifications such as "1-1024,3306" or
+"top:100" and kept as sorted ranges, so that even the full 1-65535 port space takes a few bytes, is iterated
+lazily, and can be walked in a random order without ever being expanded into a list.
+"""
+
+import bisect
+import random
+from array import array
+
+from etc import constants
+
+MIN_PORT = 1
+MAX_PORT = 65535
+
+# the port lists that can be asked for with "top:N"
+TOP_PORTS = {
+    50: constants.port_list_top_50,
+    100: constants.port_list_top_100,
+    1000: constants.port_list_top_1000,
+}
+
+
+def is_prime(n):
+    """
+    Deterministic Miller-Rabin primality test, exact for every n below 3.3 * 10 ** 24.
+
+    :type n: int
+    :rtype: bool
+    """
+    if n < 2:
+        return False
+    bases = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+    for p in bases:
+        if n % p == 0:
+            return n == p
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for a in bases:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(r - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def prime_factors(n):
+    """
+    :param n: a positive integer
+    :type n: int
+    :return: the distinct prime factors of n, found by trial division.
+    :rtype: list
+    """
+    factors = []
+    p = 2
+    while p * p <= n:
+        if n % p == 0:
+            factors.append(p)
+            while n % p == 0:
+                n //= p
+        p += 1 if p == 2 else 2
+    if n > 1:
+        factors.append(n)
+    return factors
+
+
+def permutation(n, rng=random):
+    """
+    Lazily walk the integers of [0, n) in a random order, through the cyclic group of the integers modulo
+    the smallest prime p above n: starting from a random element, each step multiplies by a random primitive
+    root g of p, which visits every integer of [1, p) exactly once, and the ones above n are skipped. Only the
+    current element is kept, so the walk takes constant memory whatever n is.
+
+    :param n: the number of integers to be permuted
+    :type n: int
+    :param rng: the source of randomness
+    :type rng: random.Random
+    :return: a generator yielding every integer of [0, n) exactly once.
+    :rtype: generator
+    """
+    if n <= 0:
+        return
+    p = n + 1
+    while not is_prime(p):
+        p += 1
+
+    # g is a primitive root of p if no g ** ((p - 1) / q) is 1, for every prime factor q of p - 1.
+    factors = prime_factors(p - 1)
+    g = 1
+    if p > 2:
+        g = rng.randrange(2, p)
+        while any(pow(g, (p - 1) // q, p) == 1 for q in factors):
+            g = rng.randrange(2, p)
+
+    x = rng.randrange(1, p)
+    for _ in range(p - 1):
+        if x <= n:
+            yield x - 1
+        x = x * g % p
+
+
+def shuffled(ports, rng=random):
+    """
+    Lazily iterate over a sequence of ports in a random order, see permutation().
+
+    :param ports: a list of ports or a PortSet
+    :type ports: list or PortSet
+    :param rng: the source of randomness
+    :type rng: random.Random
+    :rtype: generator
+    """
+    return (ports[index] for index in permutation(len(ports), rng))
+
+
+class PortSet:
+    """
+    An immutable set of ports stored as sorted, non overlapping ranges. It supports len(), membership tests
+    and indexing (in ascending order of ports) in logarithmic time, and iteration in ascending or random order.
+    """
+
+    def __init__(self, ports=None, randomize=False, seed=None):
+        """
+        :param ports: an nmap style specification such as "1-1024,3306,8000-9000" or "top:100", in which "-1024"
+        stands for "1-1024", "8000-" for "8000-65535" and "-" for every port, or 50, 100 or 1000 for the
+        corresponding list of commonly used ports, or an iterable of ports, default to the top 1000 ports.
+        :type ports: str or int or iterable
+        :param randomize: whether the ports are iterated in a random order, default to False.
+        :type randomize: bool
+        :param seed: the seed of the random order, None for a new order on every iteration.
+        :type seed: int
+        """
+        if ports is None:
+            ports = 1000
+        if isinstance(ports, PortSet):
+            ranges = ports.ranges()
+        elif isinstance(ports, str):
+            ranges = self.parse(ports)
+        elif isinstance(ports, int):
+            ranges = self.parse('top:{}'.format(ports))
+        else:
+            ranges = self.__to_ranges(ports)
+
+        self.randomize = bool(randomize)
+        self.seed = seed
+        self.__starts = array('L')
+        self.__stops = array('L')
+        # number of ports in the ranges before each range, for indexing
+        self.__offsets = array('L')
+
+        count = 0
+        for start, stop in self.__merge(ranges):
+            self.__starts.append(start)
+            self.__stops.append(stop)
+            self.__offsets.append(count)
+            count += stop - start + 1
+        self.__len = count
+
+    @staticmethod
+    def __check(port):
+        port = int(port)
+        if port < MIN_PORT or port > MAX_PORT:
+            raise ValueError('Invalid port {}. Should be within the range of [{}, {}].'.format(port, MIN_PORT, MAX_PORT))
+        return port
+
+    @staticmethod
+    def parse(spec):
+        """
+        Parse an nmap style port specification into ranges.
+
+        :param spec: the port specification, such as "1-1024,3306,8000-9000" or "top:100"
+        :type spec: str
+        :return: a list of (first port, last port) pairs, in the order of the specification.
+        :rtype: list
+        """
+        ranges = []
+        for item in spec.split(','):
+            item = item.strip()
+            if not item:
+                continue
+
+            if item.lower().startswith('top:'):
+                try:
+                    k = int(item[4:])
+                except ValueError:
+                    raise ValueError('Invalid port specification {!r}.'.format(item))
+                if k not in TOP_PORTS:
+                    raise ValueError('Invalid port rank {}. Should be 50, 100 or 1,000.'.format(k))
+                ranges.extend(PortSet.__to_ranges(TOP_PORTS[k]))
+                continue
+
+            try:
+                if '-' in item:
+                    start, stop = item.split('-', 1)
+                    start = PortSet.__check(start) if start.strip() else MIN_PORT
+                    stop = PortSet.__check(stop) if stop.strip() else MAX_PORT
+                else:
+                    start = stop = PortSet.__check(item)
+            except ValueError:
+                raise ValueError('Invalid port specification {!r}.'.format(item))
+            if start > stop:
+                raise ValueError('Invalid port range {!r}.'.format(item))
+            ranges.append((start, stop))
+
+        if not ranges:
+            raise ValueError('Empty port specification {!r}.'.format(spec))
+        return ranges
+
+    @staticmethod
+    def __to_ranges(ports):
+        """
+        :param ports: an iterable of ports
+        :type ports: iterable
+        :return: a list of (first port, last port) pairs covering the ports.
+        :rtype: list
+        """
+        ranges = []
+        for port in sorted(set(PortSet.__check(port) for port in ports)):
+            if ranges and ranges[-1][1] == port - 1:
+                ranges[-1] = (ranges[-1][0], port)
+            else:
+                ranges.append((port, port))
+        return ranges
+
+    @staticmethod
+    def __merge(ranges):
+        """
+        Sort ranges and merge the ones that overlap or touch.
+
+        :return: a list of sorted, non overlapping (first port, last port) pairs.
+        :rtype: list
+        """
+        merged = []
+        for start, stop in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+            else:
+                merged.append((start, stop))
+        return merged
+
+    def ranges(self):
+        """
+        :return: the sorted, non overlapping (first port, last port) pairs of the set.
+        :rtype: list
+        """
+        return list(zip(self.__starts, self.__stops))
+
+    def __len__(self):
+        return self.__len
+
+    def __contains__(self, port):
+        try:
+            port = int(port)
+        except (TypeError, ValueError):
+            return False
+        index = bisect.bisect_right(self.__starts, port) - 1
+        return index >= 0 and port <= self.__stops[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            positions = range(*index.indices(self.__len))
+            return PortSet((self[i] for i in positions), randomize=self.randomize, seed=self.seed)
+
+        index = int(index)
+        if index < 0:
+            index += self.__len
+        if index < 0 or index >= self.__len:
+            raise IndexError('PortSet index out of range')
+        position = bisect.bisect_right(self.__offsets, index) - 1
+        return self.__starts[position] + index - self.__offsets[position]
+
+    def __iter__(self):
+        if self.randomize:
+            rng = random.Random(self.seed)
+            return (self[index] for index in permutation(self.__len, rng))
+        return (port for start, stop in zip(self.__starts, self.__stops) for port in range(start, stop + 1))
+
+    def __eq__(self, other):
+        if isinstance(other, PortSet):
+            return self.ranges() == other.ranges()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self.ranges()))
+
+    def __str__(self):
+        return ','.join(
+            str(start) if start == stop else '{}-{}'.format(start, stop) for start, stop in self.ranges()
+        )
+
+    def __repr__(self):
+        return 'PortSet({!r})'.format(str(self))
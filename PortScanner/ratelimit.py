@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the admission control of probes. A token bucket caps the number of probes sent per
+second, and an AIMD congestion window caps the number of probes in flight, growing while probes are
+answered and halving when they time out.
+"""
+
+import asyncio
+import collections
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A token bucket holding up to burst tokens and refilled at rate tokens per second.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: the number of probes allowed per second
+        :type rate: float
+        :param burst: the number of probes that can be sent back to back, default to 50ms worth of rate
+        :type burst: float
+        """
+        self.__rate = float(rate)
+        self.__burst = max(1.0, self.__rate * 0.05) if burst is None else float(burst)
+        self.__tokens = self.__burst
+        self.__last = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take one token out of the bucket, going into debt if it is empty.
+
+        :return: the time in seconds the caller has to wait before the reserved token becomes valid.
+        :rtype: float
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.__burst, self.__tokens + (now - self.__last) * self.__rate)
+            self.__last = now
+            self.__tokens -= 1
+            if self.__tokens >= 0:
+                return 0.0
+            return -self.__tokens / self.__rate
+
+
+class CongestionWindow:
+    """
+    An AIMD congestion window over the number of probes in flight. The window grows by one per answered
+    probe until it reaches the slow start threshold, and by one per window of answered probes after that.
+    A timed out probe halves it, unless the probe was already in flight when the window was last halved,
+    so a burst of timeouts from the same round only backs off once.
+    """
+
+    def __init__(self, maximum, minimum=1, initial=10):
+        """
+        :param maximum: the upper bound of the window, usually the thread limit
+        :type maximum: int
+        :param minimum: the lower bound of the window
+        :type minimum: int
+        :param initial: the initial size of the window
+        :type initial: int
+        """
+        self.__maximum = max(1, int(maximum))
+        self.__minimum = max(1, min(int(minimum), self.__maximum))
+        self.__cwnd = float(min(max(initial, self.__minimum), self.__maximum))
+        self.__ssthresh = float(self.__maximum)
+        self.__in_flight = 0
+        # finished probes since the last back off, less the probes that were in flight at that time
+        self.__finished_since_backoff = 0
+        self.__condition = threading.Condition()
+        self.__waiters = collections.deque()
+
+    @property
+    def size(self):
+        """
+        The current size of the window.
+
+        :rtype: int
+        """
+        return int(self.__cwnd)
+
+    def __available(self):
+        return self.__in_flight < int(self.__cwnd)
+
+    def __update(self, answered):
+        """
+        Take one finished probe out of the window and resize it.
+
+        :param answered: whether the probe received a reply, as opposed to timing out, or None if it has been
+        given up on before either, which leaves the size of the window unchanged
+        :type answered: bool
+        """
+        self.__in_flight -= 1
+        self.__finished_since_backoff += 1
+
+        if answered is None:
+            return
+        elif answered:
+            if self.__cwnd < self.__ssthresh:
+                self.__cwnd += 1
+            else:
+                self.__cwnd += 1 / self.__cwnd
+            self.__cwnd = min(self.__cwnd, self.__maximum)
+
+        elif self.__finished_since_backoff > 0:
+            self.__ssthresh = max(self.__minimum, self.__cwnd / 2)
+            self.__cwnd = self.__ssthresh
+            # The probes still in flight belong to the round that has just backed off.
+            self.__finished_since_backoff = -self.__in_flight
+
+    def acquire(self):
+        """
+        Block the calling thread until the window has room for one more probe.
+        """
+        with self.__condition:
+            while not self.__available():
+                self.__condition.wait()
+            self.__in_flight += 1
+
+    def release(self, answered):
+        """
+        Record that a probe admitted by acquire() has finished.
+
+        :param answered: whether the probe received a reply, as opposed to timing out
+        :type answered: bool
+        """
+        with self.__condition:
+            self.__update(answered)
+            self.__condition.notify_all()
+
+    async def acquire_async(self):
+        """
+        Wait on the running event loop until the window has room for one more probe.
+        """
+        while not self.__available():
+            waiter = asyncio.get_running_loop().create_future()
+            self.__waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if not waiter.cancelled():
+                    # This probe had been woken up, hand its room over to another waiting one.
+                    self.__wake_up()
+                raise
+        self.__in_flight += 1
+
+    def release_async(self, answered):
+        """
+        Record that a probe admitted by acquire_async() has finished and wake up waiting probes.
+
+        :param answered: whether the probe received a reply, as opposed to timing out, or None if it has been
+        given up on before either
+        :type answered: bool
+        """
+        self.__update(answered)
+        self.__wake_up()
+
+    def __wake_up(self):
+        """
+        Wake up as many waiting probes as the window has room for.
+        """
+        room = int(self.__cwnd) - self.__in_flight
+        while room > 0 and self.__waiters:
+            waiter = self.__waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                room -= 1
+
+
+class ProbeGate:
+    """
+    Admission control of the probes of one host, combining its token buckets (usually a global and a per
+    host one) with a congestion window that may be shared by many hosts.
+    """
+
+    def __init__(self, buckets, window=None):
+        """
+        :param buckets: the token buckets every probe has to take a token from
+        :type buckets: list
+        :param window: the congestion window probes are admitted into, or None
+        :type window: CongestionWindow
+        """
+        self.__buckets = buckets
+        self.__window = window
+
+    def __reserve(self):
+        wait = 0.0
+        for bucket in self.__buckets:
+            wait = max(wait, bucket.reserve())
+        return wait
+
+    def enter(self):
+        """
+        Block the calling thread until a probe may be sent.
+        """
+        if self.__window is not None:
+            self.__window.acquire()
+        wait = self.__reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def leave(self, answered):
+        """
+        Record that a probe admitted by enter() has finished.
+
+        :param answered: whether the probe received a reply, as opposed to timing out
+        :type answered: bool
+        """
+        if self.__window is not None:
+            self.__window.release(answered)
+
+    async def enter_async(self):
+        """
+        Wait on the running event loop until a probe may be sent.
+        """
+        if self.__window is not None:
+            await self.__window.acquire_async()
+        wait = self.__reserve()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # The probe is given up on before it is sent, its room in the window is freed all the same.
+                self.leave_async(None)
+                raise
+
+    def leave_async(self, answered):
+        """
+        Record that a probe admitted by enter_async() has finished.
+
+        :param answered: whether the probe received a reply, as opposed to timing out, or None if it has been
+        given up on before either
+        :type answered: bool
+        """
+        if self.__window is not None:
+            self.__window.release_async(answered)
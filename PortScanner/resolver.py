@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the DNS resolver used by the scanner. Resolved addresses are kept in a TTL bound LRU
+cache, so that repeated scans of the same hosts spend no time in DNS, and many hosts can be resolved
+concurrently on a thread pool.
+"""
+
+import collections
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Resolver:
+    """
+    Resolve host names into ip addresses through an LRU cache whose entries expire after ttl seconds.
+    Failed resolutions are cached as well, for negative_ttl seconds. Resolution goes through getaddrinfo,
+    so IPv4 and IPv6 addresses can be asked for separately or together.
+    """
+
+    def __init__(self, ttl=300, max_size=4096, negative_ttl=30, workers=32):
+        """
+        :param ttl: the time in seconds a resolved address is cached
+        :type ttl: float
+        :param max_size: the maximum number of cached host names
+        :type max_size: int
+        :param negative_ttl: the time in seconds a failed resolution is cached
+        :type negative_ttl: float
+        :param workers: the number of threads used by resolve_many()
+        :type workers: int
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.workers = workers
+        self.__cache = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __getstate__(self):
+        # The cache travels along with the resolver to scanning processes, the lock does not.
+        with self.__lock:
+            state = self.__dict__.copy()
+            state['_Resolver__cache'] = collections.OrderedDict(self.__cache)
+        del state['_Resolver__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def __lookup(self, key):
+        """
+        :return: a (hit, ips) pair, hit is False if the key is not cached or its entry has expired.
+        :rtype: tuple
+        """
+        with self.__lock:
+            entry = self.__cache.get(key)
+            if entry is None:
+                return False, None
+            expires, ips = entry
+            if expires < time.monotonic():
+                del self.__cache[key]
+                return False, None
+            self.__cache.move_to_end(key)
+            return True, ips
+
+    def __store(self, key, ips):
+        with self.__lock:
+            ttl = self.ttl if ips else self.negative_ttl
+            self.__cache[key] = (time.monotonic() + ttl, ips)
+            self.__cache.move_to_end(key)
+            while len(self.__cache) > self.max_size:
+                self.__cache.popitem(last=False)
+
+    def resolve_all(self, host_name, family=socket.AF_UNSPEC):
+        """
+        Resolve a host name into every ip address of the given family.
+
+        :param host_name: the bare host name
+        :type host_name: str
+        :param family: socket.AF_INET, socket.AF_INET6 or socket.AF_UNSPEC for both
+        :type family: int
+        :return: the ip addresses of the host in the order of preference of getaddrinfo, empty if it
+        cannot be resolved.
+        :rtype: list
+        """
+        key = (host_name, family)
+        hit, ips = self.__lookup(key)
+        if hit:
+            return ips
+
+        try:
+            infos = socket.getaddrinfo(host_name, None, family, socket.SOCK_STREAM)
+            ips = list(collections.OrderedDict.fromkeys(info[4][0] for info in infos))
+        except socket.error:
+            ips = []
+
+        self.__store(key, ips)
+        return ips
+
+    def resolve(self, host_name, family=socket.AF_INET):
+        """
+        Resolve a host name into its preferred ip address of the given family.
+
+        :param host_name: the bare host name
+        :type host_name: str
+        :param family: socket.AF_INET, socket.AF_INET6 or socket.AF_UNSPEC for both
+        :type family: int
+        :return: the ip address of the host, or None if it cannot be resolved.
+        :rtype: str
+        """
+        ips = self.resolve_all(host_name, family)
+        return ips[0] if ips else None
+
+    def resolve_many(self, host_names, family=socket.AF_UNSPEC):
+        """
+        Resolve many host names concurrently, warming up the cache for later resolve() calls.
+
+        :param host_names: the bare host names
+        :type host_names: iterable
+        :param family: socket.AF_INET, socket.AF_INET6 or socket.AF_UNSPEC for both
+        :type family: int
+        :return: a dict in the form of {host_name: ips}, see resolve_all().
+        :rtype: dict
+        """
+        host_names = list(collections.OrderedDict.fromkeys(host_names))
+        resolved = {}
+        missing = []
+        for host_name in host_names:
+            hit, ips = self.__lookup((host_name, family))
+            if hit:
+                resolved[host_name] = ips
+            else:
+                missing.append(host_name)
+
+        if missing:
+            # The results are taken from the pool rather than from the cache, which may have evicted them.
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(missing)))) as executor:
+                ips = executor.map(lambda host_name: self.resolve_all(host_name, family), missing)
+                resolved.update(zip(missing, ips))
+
+        return {host_name: resolved[host_name] for host_name in host_names}
+
+    def clear(self):
+        """
+        Drop every cached entry.
+        """
+        with self.__lock:
+            self.__cache.clear()
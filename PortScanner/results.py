@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the scan result store. The results of a host are kept in parallel typed arrays
+instead of a dict of strings, which keeps million probe sweeps small while still recording the three
+port states, the round trip time and the errno of every probe. The services detected on open ports,
+which are few, are kept in a dict created on the first one.
+"""
+
+import math
+from array import array
+from collections.abc import Mapping
+from enum import IntEnum
+
+
+class PortStatus(IntEnum):
+    """
+    Status of a scanned port. A port is OPEN if the handshake succeeded, CLOSED if the host refused it,
+    and FILTERED if no answer came back from the host at all.
+    """
+    OPEN = 1
+    CLOSED = 2
+    FILTERED = 3
+
+    @property
+    def legacy(self):
+        """
+        The status as reported by the dict interface of older versions, 'OPEN' or 'CLOSE'.
+
+        :rtype: str
+        """
+        return 'OPEN' if self is PortStatus.OPEN else 'CLOSE'
+
+
+class ScanResult(Mapping):
+    """
+    The results of scanning one host. Used as a mapping, it behaves like the {port: 'OPEN' or 'CLOSE'}
+    dict returned by older versions. The three state status, round trip time, errno and detected service
+    of each port are available through status(), rtt(), errno() and service().
+    """
+    __slots__ = ('host', 'ip', '__ports', '__statuses', '__rtts', '__errnos', '__services', '__index')
+
+    def __init__(self, host=None, ip=None):
+        """
+        :param host: the host name (or address) that has been scanned
+        :type host: str
+        :param ip: the ip address that has been scanned
+        :type ip: str
+        """
+        self.host = host
+        self.ip = ip
+        self.__ports = array('H')
+        self.__statuses = array('B')
+        self.__rtts = array('f')
+        self.__errnos = array('H')
+        # port -> name of the service detected on it, None until a service is detected
+        self.__services = None
+        # port -> position in the arrays, built on the first lookup by port
+        self.__index = None
+
+    def add(self, port, status, rtt=None, errno=0, service=None):
+        """
+        Record the result of one probe. A port recorded again keeps every probe, but its lookups return the
+        last one.
+
+        :param port: the port that has been checked
+        :type port: int
+        :param status: the status of the port
+        :type status: PortStatus
+        :param rtt: the round trip time of the probe in seconds, or None if no reply was received
+        :type rtt: float
+        :param errno: the errno the probe failed with, 0 if none
+        :type errno: int
+        :param service: the name of the service detected on the port, or None if none was detected
+        :type service: str
+        """
+        port = int(port)
+        if self.__index is not None:
+            self.__index[port] = len(self.__ports)
+        self.__ports.append(port)
+        self.__statuses.append(status)
+        self.__rtts.append(math.nan if rtt is None else rtt)
+        self.__errnos.append(errno or 0)
+        if service is not None:
+            if self.__services is None:
+                self.__services = {}
+            self.__services[port] = service
+        elif self.__services is not None:
+            # A port probed again keeps only the service of its last probe, as its other lookups do.
+            self.__services.pop(port, None)
+
+    def extend(self, other):
+        """
+        Record every probe of another ScanResult, for example one scanned by another process.
+
+        :param other: the results to be added
+        :type other: ScanResult
+        """
+        for port, status, rtt, errno in other.records():
+            self.add(port, status, rtt, errno, other.service(port))
+
+    def __position(self, port):
+        if self.__index is None:
+            self.__index = {p: i for i, p in enumerate(self.__ports)}
+        return self.__index[port]
+
+    def __getitem__(self, port):
+        return PortStatus(self.__statuses[self.__position(port)]).legacy
+
+    def __iter__(self):
+        return iter(self.__ports)
+
+    def __len__(self):
+        return len(self.__ports)
+
+    def __repr__(self):
+        return 'ScanResult({!r}, {} ports, {} open)'.format(self.host, len(self), sum(1 for _ in self.open_ports()))
+
+    def status(self, port):
+        """
+        :param port: the port that has been checked
+        :type port: int
+        :return: the three state status of the port.
+        :rtype: PortStatus
+        """
+        return PortStatus(self.__statuses[self.__position(port)])
+
+    def rtt(self, port):
+        """
+        :param port: the port that has been checked
+        :type port: int
+        :return: the round trip time of the probe in seconds, or None if no reply was received.
+        :rtype: float
+        """
+        rtt = self.__rtts[self.__position(port)]
+        return None if math.isnan(rtt) else rtt
+
+    def errno(self, port):
+        """
+        :param port: the port that has been checked
+        :type port: int
+        :return: the errno the probe failed with, 0 if none.
+        :rtype: int
+        """
+        return self.__errnos[self.__position(port)]
+
+    def service(self, port):
+        """
+        :param port: the port that has been checked
+        :type port: int
+        :return: the name of the service detected on the port, such as 'ssh' or 'http', 'unknown' if the
+        service answered but could not be identified, or None if service detection did not run or got no answer.
+        :rtype: str
+        """
+        if self.__services is None:
+            return None
+        return self.__services.get(port)
+
+    def services(self):
+        """
+        :return: a dict in the form of {port: service name} of the ports a service has been detected on.
+        :rtype: dict
+        """
+        return dict(self.__services or {})
+
+    def open_ports(self):
+        """
+        Lazily iterate over the open ports, in the order in which they have been recorded.
+
+        :rtype: generator
+        """
+        for position, status in enumerate(self.__statuses):
+            if status == PortStatus.OPEN:
+                yield self.__ports[position]
+
+    def records(self):
+        """
+        Iterate over every recorded probe.
+
+        :return: a generator of (port, status, rtt, errno) tuples.
+        :rtype: generator
+        """
+        for position, port in enumerate(self.__ports):
+            rtt = self.__rtts[position]
+            yield port, PortStatus(self.__statuses[position]), None if math.isnan(rtt) else rtt, self.__errnos[position]
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the probe scheduler used for batch scanning. It hands out (host, port) probes
+from many hosts to a single pool of workers so that they all share one concurrency budget, spread
+evenly across the hosts and optionally in a random order and with a cap on the probes in flight per host.
+"""
+
+import itertools
+
+from portset import shuffled
+from results import ScanResult
+
+
+class HostState:
+    """
+    Book-keeping for one host that is being scanned by the ProbeScheduler.
+    """
+    __slots__ = ('name', 'ip', 'ports', 'pending', 'in_flight', 'output', 'timing', 'gate', 'timer', 'expired')
+
+    def __init__(self, name, ip, ports, output=None, rng=None, ordered=0):
+        """
+        :param name: the host name (or address) as given by the caller
+        :type name: str
+        :param ip: the ip address that is going to be scanned
+        :type ip: str
+        :param ports: the list of ports that is going to be scanned on this host
+        :type ports: list
+        :param output: the results already known for this host, or None
+        :type output: ScanResult
+        :param rng: the source of randomness the ports are walked in a random order with, or None to walk
+        them in order
+        :type rng: random.Random
+        :param ordered: the number of leading ports that are walked first and in order even if rng is given,
+        such as the ports a rescan probes first, default to 0.
+        :type ordered: int
+        """
+        self.name = name
+        self.ip = ip
+        if rng is None or ordered >= len(ports):
+            self.ports = iter(ports)
+        elif ordered > 0:
+            self.ports = itertools.chain(ports[:ordered], shuffled(ports[ordered:], rng))
+        else:
+            self.ports = shuffled(ports, rng)
+        self.pending = len(ports)
+        self.in_flight = 0
+        self.output = ScanResult(name, ip) if output is None else output
+        self.timing = None
+        self.gate = None
+        # the timer that gives up on the probes of this host at its deadline, started on its first probe
+        self.timer = None
+        self.expired = False
+
+
+class ProbeScheduler:
+    """
+    Interleave (host, port) probes over a small group of active hosts. Hosts are admitted lazily from
+    the target iterator, so a whole CIDR range never needs to be expanded in memory, and a new host is
+    admitted as soon as an active host has handed out its last port. Each host therefore finishes
+    shortly after its own probes do instead of waiting for the whole batch.
+    The ports of each host can be walked in a random order, with a constant memory permutation, and the
+    probes in flight to each host can be capped, in which case hosts at their cap are skipped and more hosts
+    are admitted when every active host is at its cap.
+    """
+
+    def __init__(self, targets, ports, host_group_size, restore=None, rng=None, host_limit=None):
+        """
+        :param targets: an iterator of (name, ip) pairs to be scanned
+        :type targets: iterator
+        :param ports: the list of ports that is going to be scanned on every host
+        :type ports: list
+        :param host_group_size: the maximum number of hosts handing out probes at the same time
+        :type host_group_size: int
+        :param restore: a function taking a host name, an ip address and the list of ports, and returning the
+        ScanResult already known for the host, the list of ports that still have to be probed, such as
+        Checkpoint.restore() does, and the number of leading ports among them that are probed first and in
+        order even if rng is given, or None to probe every port
+        :type restore: function
+        :param rng: the source of randomness the ports of each host are walked in a random order with, or
+        None to walk them in order
+        :type rng: random.Random
+        :param host_limit: the maximum number of probes in flight to a single host, or None for no limit
+        :type host_limit: int
+        """
+        self.__targets = iter(targets)
+        self.__ports = ports
+        self.__host_group_size = max(1, int(host_group_size))
+        self.__restore = restore
+        self.__rng = rng
+        self.__host_limit = host_limit
+        self.__active = []
+        # Hosts admitted with nothing left to probe, to be collected by the caller
+        self.finished = []
+        self.__cursor = 0
+        self.__exhausted = False
+
+    def __admit(self):
+        """
+        Fill the active host group from the target iterator.
+        """
+        while not self.__exhausted and len(self.__active) < self.__host_group_size:
+            try:
+                name, ip = next(self.__targets)
+            except StopIteration:
+                self.__exhausted = True
+                return
+            if self.__restore is None:
+                self.__active.append(HostState(name, ip, self.__ports, rng=self.__rng))
+                continue
+
+            output, ports, ordered = self.__restore(name, ip, self.__ports)
+            host = HostState(name, ip, ports, output, self.__rng, ordered)
+            if host.pending == 0:
+                self.finished.append(host)
+            else:
+                self.__active.append(host)
+
+    def next_probe(self):
+        """
+        Return the next probe to be sent, round robin over the active hosts that are below their cap.
+
+        :return: a (HostState, port) pair, or None if every probe has been handed out, or if every host left
+        is at its cap, in which case the probes in flight hand out the remaining ones as they complete.
+        :rtype: tuple
+        """
+        while True:
+            self.__admit()
+            if not self.__active:
+                return None
+
+            for offset in range(len(self.__active)):
+                index = (self.__cursor + offset) % len(self.__active)
+                host = self.__active[index]
+                if self.__host_limit is not None and host.in_flight >= self.__host_limit:
+                    continue
+
+                port = next(host.ports, None)
+                if port is None:
+                    # This host has handed out all of its ports, make room for the next one.
+                    del self.__active[index]
+                    break
+
+                self.__cursor = index + 1
+                host.in_flight += 1
+                return host, port
+
+            else:
+                # Every active host is at its cap, widen the group to keep the workers busy.
+                if self.__exhausted:
+                    return None
+                self.__host_group_size += 1
+
+    @staticmethod
+    def complete(host):
+        """
+        Record that one probe of the given host has finished.
+
+        :param host: the host the finished probe belongs to
+        :type host: HostState
+        :return: True if this was the last outstanding probe of the host.
+        :rtype: bool
+        """
+        host.in_flight -= 1
+        host.pending -= 1
+        return host.pending == 0
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the service detection of open ports. Once a connect succeeds, the scanner reads the banner
+the service greets with on the same connection, or sends a protocol probe when the service waits for the client
+to speak first, and matches the reply against a signature table compiled once into a single regular expression.
+"""
+
+import os
+import re
+import struct
+
+# the number of bytes of a reply that are matched
+BANNER_SIZE = 1024
+
+# probe sent to services that wait for the client, an HTTP request most text protocols answer with an error
+HTTP_HEAD = b'HEAD / HTTP/1.0\r\n\r\n'
+
+# ports on which the client starts with a TLS handshake
+TLS_PORTS = frozenset([443, 465, 563, 636, 853, 989, 990, 992, 993, 994, 995, 5061, 6697, 8443, 9443])
+
+# (service, pattern matched at the start of the reply), the first matching signature wins
+SIGNATURES = [
+    ('ssh', br'SSH-\d+\.\d+-'),
+    ('http', br'HTTP/\d\.\d \d{3}'),
+    ('tls', br'\x16\x03[\x00-\x04]..\x02|\x15\x03[\x00-\x04]\x00\x02'),
+    ('smtp', br'220[ -][^\r\n]*(?i:smtp|mail)'),
+    ('ftp', br'220[ -][^\r\n]*(?i:ftp)'),
+    ('pop3', br'\+OK'),
+    ('imap', br'\* (?:OK|PREAUTH|BYE)'),
+    ('mysql', br'...\x00\x0a\d+\.\d+|...[\x00\x01]\xff..(?:#.{5})?(?i:host)'),
+    ('postgresql', br'E...[^\x00]S(?:FATAL|ERROR)'),
+    ('redis', br'-(?:ERR|NOAUTH|DENIED)[ \w]'),
+    ('memcached', br'ERROR\r\n'),
+    ('vnc', br'RFB \d{3}\.\d{3}'),
+    ('telnet', br'\xff[\xfb-\xfe]'),
+]
+
+# every signature in one pattern, the name of the matching group is the name of the service
+SIGNATURE_PATTERN = re.compile(
+    b'|'.join(b'(?P<' + name.encode('ascii') + b'>' + pattern + b')' for name, pattern in SIGNATURES), re.DOTALL
+)
+
+
+def build_client_hello():
+    """
+    Build a TLS 1.2 ClientHello record offering the common cipher suites, which TLS services answer with
+    a ServerHello or an alert.
+
+    :rtype: bytes
+    """
+    ciphers = struct.pack(
+        '!13H', 0x1301, 0x1302, 0x1303, 0xc02b, 0xc02f, 0xc02c, 0xc030, 0xcca9, 0xcca8, 0x009c, 0x009d, 0x002f,
+        0x0035
+    )
+
+    def extension(kind, data):
+        return struct.pack('!HH', kind, len(data)) + data
+
+    extensions = (
+        # supported groups: x25519, secp256r1, secp384r1
+        extension(0x000a, struct.pack('!4H', 6, 0x001d, 0x0017, 0x0018)) +
+        # EC point formats: uncompressed
+        extension(0x000b, b'\x01\x00') +
+        # signature algorithms
+        extension(0x000d, struct.pack('!9H', 16, 0x0403, 0x0804, 0x0401, 0x0503, 0x0805, 0x0501, 0x0806, 0x0601))
+    )
+    body = (
+        b'\x03\x03' + os.urandom(32) + b'\x00' +
+        struct.pack('!H', len(ciphers)) + ciphers + b'\x01\x00' +
+        struct.pack('!H', len(extensions)) + extensions
+    )
+    handshake = b'\x01' + struct.pack('!I', len(body))[1:] + body
+    return b'\x16\x03\x01' + struct.pack('!H', len(handshake)) + handshake
+
+
+CLIENT_HELLO = build_client_hello()
+
+
+def probe_for(port_number):
+    """
+    :param port_number: the open port
+    :type port_number: int
+    :return: the probe to be sent to a port that sent no banner.
+    :rtype: bytes
+    """
+    return CLIENT_HELLO if int(port_number) in TLS_PORTS else HTTP_HEAD
+
+
+def identify(data):
+    """
+    Match a banner or a reply to a probe against the signature table.
+
+    :param data: the bytes received from the service
+    :type data: bytes
+    :return: the name of the service, 'unknown' if nothing matches, or None if nothing was received.
+    :rtype: str
+    """
+    if not data:
+        return None
+    match = SIGNATURE_PATTERN.match(data[:BANNER_SIZE])
+    return 'unknown' if match is None else match.lastgroup
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the multi-process scan driver. The ports or the hosts to be scanned are split into shards,
+each shard is scanned by its own process with its own event loop, and the per-host results of every shard are
+merged back into a single ScanResult, so socket handling spreads over all CPU cores instead of one.
+"""
+
+import multiprocessing
+import queue
+import zlib
+
+# Messages sent by the shard processes
+RESULT = 'result'
+DONE = 'done'
+ERROR = 'error'
+
+
+def split(ports, shards):
+    """
+    Split a port list into shards. Ports are dealt out round robin, so that each shard gets its share of the
+    commonly used ports at the head of the list.
+
+    :param ports: the list of ports to be split
+    :type ports: list
+    :param shards: the number of shards
+    :type shards: int
+    :return: the non empty shards.
+    :rtype: list
+    """
+    return [shard for shard in (ports[i::shards] for i in range(shards)) if shard]
+
+
+def owns(host, shard, shards):
+    """
+    Tell whether a host belongs to a shard when the hosts are split across shards. Hosts are dealt out by
+    a hash of their name or address that is the same in every process, so that each process expands and
+    resolves its own hosts only.
+
+    :param host: the host name or ip address
+    :type host: str
+    :param shard: the index of the shard
+    :type shard: int
+    :param shards: the number of shards
+    :type shards: int
+    :rtype: bool
+    """
+    return zlib.crc32(host.encode('utf-8')) % shards == shard
+
+
+def _scan_shard(scanner, targets, message, all_addresses, results):
+    """
+    Entry point of a shard process, scan the targets with scanner.scan_many() and send each host back
+    as soon as it is completely scanned.
+
+    :param scanner: the PortScanner scanning one shard of the ports
+    :type scanner: PortScanner
+    :param results: the queue the results are sent back through
+    :type results: multiprocessing.Queue
+    """
+    try:
+        for host, output in scanner.scan_many(targets, message, all_addresses):
+            results.put((RESULT, host, output))
+    except BaseException as e:
+        results.put((ERROR, None, e))
+    else:
+        results.put((DONE, None, None))
+
+
+def scan(scanners, targets, message='', all_addresses=False, split_hosts=False):
+    """
+    Scan the targets with one process per scanner and merge the results of each host.
+
+    :param scanners: the PortScanner of each shard, differing only in their target ports or in their hosts
+    :type scanners: list
+    :param targets: a list of host names, ip addresses and CIDR ranges, see PortScanner.scan_many()
+    :type targets: list
+    :param message: the message that is going to be included in the scanning packets
+    :type message: str
+    :param all_addresses: whether a host name is expanded into every address it resolves to
+    :type all_addresses: bool
+    :param split_hosts: whether the hosts are split across the shards, so that each host is scanned by
+    a single shard, otherwise the ports are
+    :type split_hosts: bool
+    :return: a generator yielding (host, ScanResult) pairs as soon as every shard has scanned the host.
+    :rtype: generator
+    """
+    # the number of shards each host is scanned by
+    shards_per_host = 1 if split_hosts else len(scanners)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_scan_shard, args=(scanner, targets, message, all_addresses, results))
+        for scanner in scanners
+    ]
+    for process in processes:
+        process.daemon = True
+        process.start()
+
+    # (host, ip) -> [merged ScanResult, number of shards merged so far]
+    partial = {}
+    running = len(processes)
+    try:
+        while running:
+            try:
+                kind, host, output = results.get(timeout=0.5)
+            except queue.Empty:
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    raise RuntimeError('A scanning process died unexpectedly.')
+                continue
+
+            if kind == DONE:
+                running -= 1
+                continue
+            if kind == ERROR:
+                raise output
+
+            key = (host, output.ip)
+            entry = partial.get(key)
+            if entry is None:
+                entry = partial[key] = [output, 0]
+            else:
+                entry[0].extend(output)
+            entry[1] += 1
+            if entry[1] == shards_per_host:
+                del partial[key]
+                yield host, entry[0]
+
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+        results.close()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the SYN (half-open) prober. Crafted SYN packets are sent from one raw socket per address
+family and the SYN-ACK or RST replies are matched by a single receive loop on the event loop, so no connection
+is ever established and no file descriptor is spent per port. It needs a Linux host and root privileges.
+"""
+
+import asyncio
+import errno
+import os
+import platform
+import random
+import socket
+import struct
+
+from results import PortStatus
+
+# TCP flags
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# receive buffer size of the raw sockets in bytes, capped by the kernel (net.core.rmem_max on Linux)
+RECEIVE_BUFFER_SIZE = 4 << 20
+
+
+def is_supported():
+    """
+    Check whether SYN scanning can be performed on this host.
+
+    :return: True on Linux with root privileges.
+    :rtype: bool
+    """
+    return platform.system() == 'Linux' and hasattr(os, 'geteuid') and os.geteuid() == 0
+
+
+def checksum(data):
+    """
+    Compute the internet checksum (RFC 1071) of the given bytes.
+
+    :param data: the bytes to be checksummed
+    :type data: bytes
+    :rtype: int
+    """
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack('!{}H'.format(len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def build_syn(family, src_ip, dst_ip, src_port, dst_port, seq):
+    """
+    Build the TCP header of a SYN packet, the IP header is added by the kernel.
+
+    :param family: the address family, socket.AF_INET or socket.AF_INET6
+    :type family: int
+    :param src_ip: the source ip address
+    :type src_ip: str
+    :param dst_ip: the destination ip address
+    :type dst_ip: str
+    :param src_port: the source port
+    :type src_port: int
+    :param dst_port: the destination port
+    :type dst_port: int
+    :param seq: the sequence number
+    :type seq: int
+    :rtype: bytes
+    """
+    header = struct.pack('!HHLLBBHHH', src_port, dst_port, seq, 0, 5 << 4, TCP_SYN, 1024, 0, 0)
+    src, dst = socket.inet_pton(family, src_ip), socket.inet_pton(family, dst_ip)
+    if family == socket.AF_INET6:
+        pseudo_header = struct.pack('!16s16sL3xB', src, dst, len(header), socket.IPPROTO_TCP)
+    else:
+        pseudo_header = struct.pack('!4s4sBBH', src, dst, 0, socket.IPPROTO_TCP, len(header))
+    return header[:16] + struct.pack('!H', checksum(pseudo_header + header)) + header[18:]
+
+
+class SynProber:
+    """
+    Send SYN probes from one raw socket per address family and resolve them from the replies read on
+    the event loop.
+    A SYN-ACK means the port is OPEN, a RST means it is CLOSED, and no reply before the timeout means
+    it is FILTERED.
+    """
+
+    def __init__(self):
+        self.__socks = {}
+        self.__loop = None
+        self.__src_port = random.randint(40000, 60000)
+        self.__src_ips = {}
+        # Outstanding probes keyed by (packed ip, port, expected acknowledgement number)
+        self.__pending = {}
+
+    def open(self):
+        """
+        Open the raw sockets and start the receive loop on the running event loop. IPv6 is only
+        probed if the host supports it.
+        """
+        self.__loop = asyncio.get_running_loop()
+        for family in (socket.AF_INET, socket.AF_INET6):
+            try:
+                sock = socket.socket(family, socket.SOCK_RAW, socket.IPPROTO_TCP)
+            except socket.error:
+                if family == socket.AF_INET:
+                    raise
+                continue
+            sock.setblocking(False)
+            # A raw socket receives every TCP segment of the host, make room for bursts of replies.
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+            except socket.error:
+                pass
+            self.__socks[family] = sock
+            self.__loop.add_reader(sock.fileno(), self.__receive, family)
+
+    def close(self):
+        """
+        Stop the receive loop and close the raw sockets.
+        """
+        for sock in self.__socks.values():
+            self.__loop.remove_reader(sock.fileno())
+            sock.close()
+        self.__socks = {}
+
+    def __source_ip(self, family, ip):
+        """
+        Return the local address the kernel routes packets to the given ip address from.
+
+        :param family: the address family, socket.AF_INET or socket.AF_INET6
+        :type family: int
+        :param ip: the destination ip address
+        :type ip: str
+        :rtype: str
+        """
+        src_ip = self.__src_ips.get(ip)
+        if src_ip is None:
+            route_sock = socket.socket(family, socket.SOCK_DGRAM)
+            try:
+                route_sock.connect((ip, 9))
+                src_ip = route_sock.getsockname()[0]
+            finally:
+                route_sock.close()
+            self.__src_ips[ip] = src_ip
+        return src_ip
+
+    def __receive(self, family):
+        """
+        Read every pending packet from the raw socket of the given family and resolve the probes they answer.
+        IPv4 raw sockets deliver the IP header along with the TCP segment, IPv6 raw sockets do not.
+
+        :param family: the address family, socket.AF_INET or socket.AF_INET6
+        :type family: int
+        """
+        sock = self.__socks[family]
+        while True:
+            try:
+                packet, address = sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except socket.error:
+                return
+
+            if family == socket.AF_INET:
+                ihl = (packet[0] & 0x0f) * 4
+                if len(packet) < ihl + 14 or packet[9] != socket.IPPROTO_TCP:
+                    continue
+                src = packet[12:16]
+                segment = packet[ihl:ihl + 14]
+            else:
+                if len(packet) < 14:
+                    continue
+                src = socket.inet_pton(family, address[0].split('%')[0])
+                segment = packet[:14]
+
+            src_port, dst_port, seq, ack, offset, flags = struct.unpack('!HHLLBB', segment)
+            if dst_port != self.__src_port:
+                continue
+
+            key = (src, src_port, ack)
+            waiter = self.__pending.pop(key, None)
+            if waiter is None or waiter.done():
+                continue
+
+            if flags & TCP_SYN and flags & TCP_ACK:
+                waiter.set_result(PortStatus.OPEN)
+            elif flags & TCP_RST:
+                waiter.set_result(PortStatus.CLOSED)
+
+    async def probe(self, ip, port_number, timing):
+        """
+        Send one SYN probe and wait for its reply.
+
+        :param ip: the ip address that is being scanned
+        :type ip: str
+        :param port_number: the port that is going to be checked
+        :type port_number: int
+        :param timing: the timeout estimator of the host, fed with the measured round trip time
+        :type timing: TimeoutEstimator
+        :return: status of the port, the round trip time in seconds of the probe, or None if no reply
+        was received, and the errno of the probe, 0 if none.
+        :rtype: tuple
+        """
+        port_number = int(port_number)
+        family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+        sock = self.__socks.get(family)
+        if sock is None:
+            return PortStatus.FILTERED, None, errno.EAFNOSUPPORT
+
+        seq = random.getrandbits(32)
+        key = (socket.inet_pton(family, ip), port_number, (seq + 1) & 0xffffffff)
+        waiter = self.__loop.create_future()
+        self.__pending[key] = waiter
+
+        delay = timing.timeout()
+        start_time = self.__loop.time()
+        try:
+            packet = build_syn(family, self.__source_ip(family, ip), ip, self.__src_port, port_number, seq)
+            while True:
+                try:
+                    sock.sendto(packet, (ip, 0))
+                    break
+                except BlockingIOError:
+                    # The send buffer of the raw socket is full, give the receive loop a chance to run.
+                    await asyncio.sleep(0.001)
+            status = await asyncio.wait_for(waiter, delay)
+
+        except asyncio.TimeoutError:
+            return PortStatus.FILTERED, None, errno.ETIMEDOUT
+
+        except socket.error as e:
+            return PortStatus.FILTERED, None, e.errno or 0
+
+        finally:
+            self.__pending.pop(key, None)
+
+        rtt = self.__loop.time() - start_time
+        timing.update(rtt)
+        return status, rtt, 0 if status == PortStatus.OPEN else errno.ECONNREFUSED
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the tests of the scan checkpoint: loading a file cut short by a crash and restoring the recorded probes.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# The modules of the scanner import each other by their top-level name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkpoint import Checkpoint
+from results import PortStatus
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'scan.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def test_truncated_last_line(self):
+        self.write(
+            '{"host":"a","ip":"10.0.0.1","port":22,"status":"OPEN","rtt":0.01,"errno":0,"service":"ssh"}\n'
+            'not json\n'
+            '{"host":"a","ip":"10.0.0.1","port":23,"status":"CLOSED","rtt":0.01,"errno":111}\n'
+            '{"host":"a","ip":"10.0.0.1","port":80,"sta'
+        )
+        checkpoint = Checkpoint(self.path)
+        output, ports = checkpoint.restore('a', '10.0.0.1', [22, 23, 80, 443])
+        self.assertEqual(ports, [80, 443])
+        self.assertEqual(output.status(22), PortStatus.OPEN)
+        self.assertEqual(output.service(22), 'ssh')
+        self.assertEqual(output.status(23), PortStatus.CLOSED)
+
+        # The next record starts on a line of its own instead of being glued to the truncated one.
+        checkpoint.record('a', '10.0.0.1', 80, PortStatus.FILTERED, None, 110)
+        checkpoint.close()
+        recorded = Checkpoint.read(self.path)['10.0.0.1']
+        self.assertEqual(sorted(recorded), [22, 23, 80])
+        self.assertEqual(recorded.status(80), PortStatus.FILTERED)
+        self.assertIsNone(recorded.rtt(80))
+
+    def test_repeated_port(self):
+        # A rescan records the ports it probes again, the last record of a port is the one that counts.
+        checkpoint = Checkpoint(self.path)
+        checkpoint.record('a', '10.0.0.1', 22, PortStatus.OPEN, 0.01, 0, 'ssh')
+        checkpoint.record('a', '10.0.0.1', 23, PortStatus.CLOSED, 0.01, 111)
+        checkpoint.record('a', '10.0.0.1', 22, PortStatus.CLOSED, 0.02, 111)
+        checkpoint.close()
+
+        recorded = Checkpoint.read(self.path)['10.0.0.1']
+        self.assertEqual(list(recorded), [22, 23])
+        self.assertEqual(recorded.status(22), PortStatus.CLOSED)
+        self.assertIsNone(recorded.service(22))
+        self.assertEqual(list(recorded.open_ports()), [])
+
+        checkpoint = Checkpoint(self.path)
+        output, ports = checkpoint.restore('a', '10.0.0.1', [22, 23, 80])
+        checkpoint.close()
+        self.assertEqual(ports, [80])
+        self.assertEqual(len(output), 2)
+        self.assertEqual(output.status(22), PortStatus.CLOSED)
+        self.assertAlmostEqual(output.rtt(22), 0.02)
+
+    def test_restore_unknown_address(self):
+        checkpoint = Checkpoint(self.path)
+        output, ports = checkpoint.restore('b', '10.0.0.2', [1, 2])
+        checkpoint.close()
+        self.assertEqual((len(output), ports), (0, [1, 2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the tests of the differential rescan: planning the ports to probe again, listing the
+changes and merging a rescan into the previous results.
+"""
+
+import os
+import sys
+import unittest
+
+# The modules of the scanner import each other by their top-level name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import differential
+from results import PortStatus, ScanResult
+
+
+class DifferentialTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ports = list(range(1, 101))
+        self.previous = ScanResult('a', '10.0.0.1')
+        for port in self.ports:
+            status = PortStatus.OPEN if port in (22, 80) else PortStatus.CLOSED
+            self.previous.add(port, status, 0.01, 0, 'ssh' if port == 22 else None)
+
+    def test_plan_rotation(self):
+        tails = []
+        for rotation in range(4):
+            planned = differential.plan(self.previous, self.ports, 0.25, rotation)
+            self.assertEqual(planned[:2], [22, 80])
+            tails.append(planned[2:])
+
+        # Each rotation probes a quarter of the other ports, and four rotations cover them all once.
+        self.assertTrue(all(len(tail) == 25 or len(tail) == 24 for tail in tails))
+        covered = [port for tail in tails for port in tail]
+        self.assertEqual(sorted(covered), [port for port in self.ports if port not in (22, 80)])
+        self.assertEqual(differential.plan(self.previous, self.ports, 0.25, 5), [22, 80] + tails[1])
+
+    def test_plan_edges(self):
+        self.assertEqual(differential.plan(self.previous, self.ports, 0, 3), [22, 80])
+        self.assertEqual(differential.plan(self.previous, self.ports, 1, 3)[2:], [
+            port for port in self.ports if port not in (22, 80)
+        ])
+        self.assertEqual(differential.plan(None, self.ports, 0.1, 3), self.ports)
+
+    def test_changes_and_merge(self):
+        current = ScanResult('a', '10.0.0.1')
+        current.add(22, PortStatus.CLOSED, 0.01, 111)
+        current.add(80, PortStatus.OPEN, 0.01, 0, 'http')
+        current.add(3, PortStatus.OPEN, 0.01, 0)
+        current.add(4, PortStatus.FILTERED, None, 110)
+        current.add(8080, PortStatus.OPEN, 0.01, 0)
+
+        self.assertEqual(differential.changes(self.previous, current), [
+            (3, PortStatus.CLOSED, PortStatus.OPEN),
+            (22, PortStatus.OPEN, PortStatus.CLOSED),
+            (8080, None, PortStatus.OPEN),
+        ])
+        self.assertEqual(differential.changes(None, current), [
+            (3, None, PortStatus.OPEN), (80, None, PortStatus.OPEN), (8080, None, PortStatus.OPEN)
+        ])
+
+        merged = differential.merge(self.previous, current)
+        self.assertEqual(len(merged), 101)
+        self.assertEqual(merged.status(22), PortStatus.CLOSED)
+        self.assertEqual(merged.status(4), PortStatus.FILTERED)
+        self.assertEqual(merged.status(5), PortStatus.CLOSED)
+        self.assertEqual(merged.services(), {80: 'http'})
+
+
+if __name__ == '__main__':
+    unittest.main()
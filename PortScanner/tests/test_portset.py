@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the tests of the port sets and of the random permutations the ports are walked with.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+# The modules of the scanner import each other by their top-level name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from portset import MAX_PORT, TOP_PORTS, PortSet, is_prime, permutation, prime_factors, shuffled
+
+
+class PortSetParseTest(unittest.TestCase):
+
+    def test_ranges(self):
+        self.assertEqual(PortSet.parse('22, 80-82,3306'), [(22, 22), (80, 82), (3306, 3306)])
+        self.assertEqual(PortSet.parse('-1024'), [(1, 1024)])
+        self.assertEqual(PortSet.parse('8000-'), [(8000, MAX_PORT)])
+        self.assertEqual(PortSet.parse('-'), [(1, MAX_PORT)])
+        self.assertEqual(PortSet('top:100'), PortSet(TOP_PORTS[100]))
+
+    def test_overlapping_ranges_are_merged(self):
+        self.assertEqual(PortSet('1-10,5-20,21,30').ranges(), [(1, 21), (30, 30)])
+
+    def test_errors(self):
+        for spec, message in (
+            ('http', 'Invalid port specification'),
+            ('0', 'Invalid port specification'),
+            ('65536', 'Invalid port specification'),
+            ('1-2-3', 'Invalid port specification'),
+            ('top:ten', 'Invalid port specification'),
+            ('top:7', 'Invalid port rank'),
+            ('100-10', 'Invalid port range'),
+            ('', 'Empty port specification'),
+            (' , ,', 'Empty port specification'),
+        ):
+            with self.assertRaises(ValueError) as context:
+                PortSet.parse(spec)
+            self.assertIn(message, str(context.exception), spec)
+
+
+class PermutationTest(unittest.TestCase):
+
+    def test_is_prime(self):
+        sieve = [True] * 5000
+        sieve[0] = sieve[1] = False
+        for i in range(2, 5000):
+            if sieve[i]:
+                for j in range(i * i, 5000, i):
+                    sieve[j] = False
+        self.assertEqual([n for n in range(5000) if is_prime(n)], [n for n in range(5000) if sieve[n]])
+        self.assertTrue(is_prime(65537))
+        self.assertEqual(prime_factors(65536), [2])
+        self.assertEqual(prime_factors(2 * 3 * 3 * 7 * 65537), [2, 3, 7, 65537])
+
+    def test_covers_every_port(self):
+        for n in (0, 1, 2, 3, 10, 96, 97, 1000, MAX_PORT):
+            for seed in range(3):
+                walk = list(permutation(n, random.Random(seed)))
+                self.assertEqual(len(walk), n)
+                self.assertEqual(set(walk), set(range(n)))
+
+    def test_order_depends_on_the_seed(self):
+        self.assertEqual(list(permutation(1000, random.Random(1))), list(permutation(1000, random.Random(1))))
+        self.assertNotEqual(list(permutation(1000, random.Random(1))), list(permutation(1000, random.Random(2))))
+
+    def test_shuffled_port_sets(self):
+        ports = PortSet('1-100,443,8000-8100')
+        self.assertEqual(sorted(shuffled(ports, random.Random(5))), list(ports))
+        randomized = PortSet('1-100,443,8000-8100', randomize=True, seed=5)
+        self.assertEqual(sorted(randomized), list(ports))
+        self.assertNotEqual(list(randomized), list(ports))
+
+
+if __name__ == '__main__':
+    unittest.main()
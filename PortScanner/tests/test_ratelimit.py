@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the tests of the token bucket and of the AIMD congestion window.
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+
+# The modules of the scanner import each other by their top-level name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import CongestionWindow, TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_then_debt(self):
+        bucket = TokenBucket(10, burst=2)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        # Once empty, each reservation waits one more token, 1 / rate seconds, behind the previous one.
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+    def test_default_burst(self):
+        bucket = TokenBucket(1000)
+        waits = [bucket.reserve() for _ in range(51)]
+        self.assertEqual(waits[:50], [0.0] * 50)
+        self.assertGreater(waits[50], 0.0)
+
+
+class CongestionWindowTest(unittest.TestCase):
+
+    def fill(self, window, count):
+        for _ in range(count):
+            window.acquire()
+
+    def test_slow_start_then_avoidance(self):
+        window = CongestionWindow(100, initial=4)
+        self.fill(window, 4)
+        for _ in range(4):
+            window.release(True)
+        self.assertEqual(window.size, 8)
+
+        # A round of timeouts halves the window, and the threshold then slows its growth to one per window.
+        self.fill(window, 8)
+        for _ in range(8):
+            window.release(False)
+        self.assertEqual(window.size, 4)
+        self.fill(window, 4)
+        for _ in range(4):
+            window.release(True)
+        self.assertEqual(window.size, 4)
+        self.fill(window, 1)
+        window.release(True)
+        self.assertEqual(window.size, 5)
+
+    def test_one_backoff_per_round(self):
+        window = CongestionWindow(100, initial=10)
+        self.fill(window, 10)
+        window.release(False)
+        self.assertEqual(window.size, 5)
+        # The other probes of the same round time out as well, but the window has already backed off.
+        for _ in range(9):
+            window.release(False)
+        self.assertEqual(window.size, 5)
+
+        # A probe sent after the back off does halve it again.
+        self.fill(window, 1)
+        window.release(False)
+        self.assertEqual(window.size, 2)
+
+    def test_bounds(self):
+        window = CongestionWindow(12, minimum=2, initial=10)
+        for _ in range(5):
+            self.fill(window, 1)
+            window.release(True)
+        self.assertEqual(window.size, 12)
+
+        for _ in range(10):
+            self.fill(window, window.size)
+            for _ in range(window.size):
+                window.release(False)
+        self.assertEqual(window.size, 2)
+
+    def test_waiters_are_woken_up(self):
+        async def scenario():
+            window = CongestionWindow(100, initial=2)
+            await window.acquire_async()
+            await window.acquire_async()
+            waiter = asyncio.ensure_future(window.acquire_async())
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+            window.release_async(True)
+            await asyncio.wait_for(waiter, 1)
+
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the tests of the scan result store.
+"""
+
+import errno
+import os
+import pickle
+import sys
+import unittest
+
+# The modules of the scanner import each other by their top-level name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from results import PortStatus, ScanResult
+
+
+class ScanResultTest(unittest.TestCase):
+
+    def setUp(self):
+        self.result = ScanResult('localhost', '127.0.0.1')
+        self.result.add(22, PortStatus.OPEN, 0.001, service='ssh')
+        self.result.add(23, PortStatus.CLOSED, 0.002, errno.ECONNREFUSED)
+        self.result.add(24, PortStatus.FILTERED, None, errno.ETIMEDOUT)
+
+    def test_lookup(self):
+        self.assertEqual(self.result.status(22), PortStatus.OPEN)
+        self.assertAlmostEqual(self.result.rtt(23), 0.002)
+        self.assertIsNone(self.result.rtt(24))
+        self.assertEqual(self.result.errno(22), 0)
+        self.assertEqual(self.result.errno(24), errno.ETIMEDOUT)
+        self.assertEqual(self.result.service(22), 'ssh')
+        self.assertIsNone(self.result.service(23))
+        with self.assertRaises(KeyError):
+            self.result.status(25)
+
+    def test_lookup_after_add(self):
+        # The first lookup builds the index, which the later probes have to be added to.
+        self.assertEqual(self.result.status(22), PortStatus.OPEN)
+        self.result.add(80, PortStatus.OPEN, 0.003, service='http')
+        self.assertEqual(self.result.status(80), PortStatus.OPEN)
+        self.assertEqual(self.result.service(80), 'http')
+        self.assertEqual(self.result.status(24), PortStatus.FILTERED)
+
+    def test_repeated_port(self):
+        # Every probe is kept, but a lookup by port returns the last one, whether the index exists or not.
+        self.result.add(24, PortStatus.OPEN, 0.004)
+        self.assertEqual(self.result.status(24), PortStatus.OPEN)
+        self.result.add(24, PortStatus.CLOSED, 0.005, errno.ECONNREFUSED)
+        self.assertEqual(self.result.status(24), PortStatus.CLOSED)
+        self.assertEqual(self.result.errno(24), errno.ECONNREFUSED)
+        self.assertEqual(len(self.result), 5)
+        # The service of an earlier probe does not outlive a later one that found none.
+        self.result.add(22, PortStatus.OPEN, 0.001)
+        self.assertIsNone(self.result.service(22))
+
+    def test_legacy_mapping(self):
+        self.assertEqual(dict(self.result), {22: 'OPEN', 23: 'CLOSE', 24: 'CLOSE'})
+        self.assertEqual(list(self.result), [22, 23, 24])
+        self.assertIn(23, self.result)
+        self.assertNotIn(25, self.result)
+
+    def test_open_ports_and_records(self):
+        self.assertEqual(list(self.result.open_ports()), [22])
+        self.assertEqual(self.result.services(), {22: 'ssh'})
+        records = list(self.result.records())
+        self.assertEqual([record[:2] for record in records],
+                         [(22, PortStatus.OPEN), (23, PortStatus.CLOSED), (24, PortStatus.FILTERED)])
+        self.assertIsNone(records[2][2])
+        self.assertEqual(records[1][3], errno.ECONNREFUSED)
+
+    def test_extend(self):
+        other = ScanResult('localhost', '127.0.0.1')
+        other.add(80, PortStatus.OPEN, 0.003, service='http')
+        self.result.extend(other)
+        self.assertEqual(list(self.result), [22, 23, 24, 80])
+        self.assertEqual(self.result.services(), {22: 'ssh', 80: 'http'})
+
+    def test_pickling(self):
+        # Results are pickled back from the worker processes of a sharded scan.
+        self.result.status(22)
+        copy = pickle.loads(pickle.dumps(self.result))
+        self.assertEqual((copy.host, copy.ip), ('localhost', '127.0.0.1'))
+        self.assertEqual(list(copy.records()), list(self.result.records()))
+        self.assertEqual(copy.services(), {22: 'ssh'})
+        copy.add(80, PortStatus.OPEN)
+        self.assertEqual(copy.status(80), PortStatus.OPEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
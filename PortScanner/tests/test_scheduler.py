@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the tests of the probe scheduler of batch scans: the round robin over the hosts, the cap on
+the probes in flight per host, the widening of the host group and the restoring of known results.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+# The modules of the scanner import each other by their top-level name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from results import PortStatus, ScanResult
+from scheduler import HostState, ProbeScheduler
+
+
+def targets(*names):
+    return [(name, name) for name in names]
+
+
+class ProbeSchedulerTest(unittest.TestCase):
+
+    def drain(self, scheduler):
+        """
+        Hand out every probe, completing each of them at once.
+
+        :return: the probes as (host name, port) pairs, and the names of the hosts in the order they finished.
+        """
+        probes = []
+        finished = []
+        while True:
+            probe = scheduler.next_probe()
+            if probe is None:
+                return probes, finished
+            host, port = probe
+            probes.append((host.name, port))
+            if scheduler.complete(host):
+                finished.append(host.name)
+
+    def test_every_probe_is_handed_out(self):
+        scheduler = ProbeScheduler(targets('a', 'b', 'c'), [1, 2, 3], 2)
+        probes, finished = self.drain(scheduler)
+        self.assertEqual(sorted(probes), [(name, port) for name in 'abc' for port in (1, 2, 3)])
+        self.assertEqual(sorted(finished), ['a', 'b', 'c'])
+
+    def test_round_robin(self):
+        scheduler = ProbeScheduler(targets('a', 'b'), [1, 2], 2)
+        probes, _ = self.drain(scheduler)
+        self.assertEqual(probes, [('a', 1), ('b', 1), ('a', 2), ('b', 2)])
+
+    def test_host_limit_widens_the_group(self):
+        scheduler = ProbeScheduler(targets('a', 'b', 'c'), [1, 2, 3, 4], 1, host_limit=2)
+        probes = [scheduler.next_probe() for _ in range(6)]
+        # Once a is at its cap, b and then c are admitted to keep the workers busy.
+        self.assertEqual([(host.name, port) for host, port in probes],
+                         [('a', 1), ('a', 2), ('b', 1), ('b', 2), ('c', 1), ('c', 2)])
+        self.assertTrue(all(host.in_flight <= 2 for host, _ in probes))
+
+        # Every host is at its cap and there is no host left to admit, the worker returns.
+        self.assertIsNone(scheduler.next_probe())
+        host = probes[0][0]
+        scheduler.complete(host)
+        self.assertEqual(scheduler.next_probe(), (host, 3))
+
+    def test_random_order(self):
+        ports = list(range(1, 101))
+        scheduler = ProbeScheduler(targets('a', 'b'), ports, 2, rng=random.Random(1))
+        probes, _ = self.drain(scheduler)
+        for name in 'ab':
+            walk = [port for host, port in probes if host == name]
+            self.assertEqual(sorted(walk), ports)
+            self.assertNotEqual(walk, ports)
+
+    def test_ordered_head(self):
+        host = HostState('a', 'a', [50, 7, 1, 2, 3, 4, 5, 6, 8, 9], rng=random.Random(1), ordered=2)
+        walk = list(host.ports)
+        self.assertEqual(walk[:2], [50, 7])
+        self.assertEqual(sorted(walk[2:]), [1, 2, 3, 4, 5, 6, 8, 9])
+
+    def test_restore(self):
+        def restore(name, ip, ports):
+            output = ScanResult(name, ip)
+            if name == 'done':
+                for port in ports:
+                    output.add(port, PortStatus.CLOSED)
+                return output, [], 0
+            output.add(1, PortStatus.OPEN)
+            return output, [3, 2], 1
+
+        scheduler = ProbeScheduler(targets('done', 'a'), [1, 2, 3], 2, restore, random.Random(1))
+        probes, finished = self.drain(scheduler)
+        self.assertEqual(probes[0], ('a', 3))
+        self.assertEqual(sorted(probes), [('a', 2), ('a', 3)])
+        self.assertEqual(finished, ['a'])
+
+        # A host with nothing left to probe is handed back without a probe.
+        self.assertEqual([host.name for host in scheduler.finished], ['done'])
+        self.assertEqual(len(scheduler.finished[0].output), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
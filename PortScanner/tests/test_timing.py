@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the tests of the per host timeout estimator.
+"""
+
+import os
+import sys
+import unittest
+
+# The modules of the scanner import each other by their top-level name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from timing import TimeoutEstimator
+
+
+class TimeoutEstimatorTest(unittest.TestCase):
+
+    def test_fixed_delay(self):
+        timing = TimeoutEstimator(2.0)
+        timing.update(0.01)
+        self.assertEqual(timing.timeout(), 2.0)
+
+    def test_delay_until_first_measure(self):
+        self.assertEqual(TimeoutEstimator(2.0, adaptive=True).timeout(), 2.0)
+
+    def test_smoothing(self):
+        timing = TimeoutEstimator(2.0, adaptive=True)
+        # The first measure sets SRTT = R and RTTVAR = R / 2 (RFC 6298 2.2).
+        timing.update(0.1)
+        self.assertAlmostEqual(timing.timeout(), 0.1 + 4 * 0.05)
+        # Then RTTVAR = 3/4 RTTVAR + 1/4 |SRTT - R| and SRTT = 7/8 SRTT + 1/8 R (RFC 6298 2.3).
+        timing.update(0.5)
+        self.assertAlmostEqual(timing.timeout(), 0.15 + 4 * (0.75 * 0.05 + 0.25 * 0.4))
+
+    def test_bounds(self):
+        timing = TimeoutEstimator(2.0, adaptive=True, min_delay=0.1)
+        timing.update(0.001)
+        self.assertEqual(timing.timeout(), 0.1)
+
+        timing = TimeoutEstimator(2.0, adaptive=True)
+        timing.update(1.5)
+        self.assertEqual(timing.timeout(), 2.0)
+
+        timing = TimeoutEstimator(2.0, adaptive=True, max_delay=5.0)
+        timing.update(2.0)
+        self.assertEqual(timing.timeout(), 5.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the per host timeout estimator. In adaptive mode the timeout of a host is derived
+from the round trip times measured on its answered probes, in the same way as TCP (RFC 6298) and nmap
+derive their retransmission timeouts.
+"""
+
+import threading
+
+
+class TimeoutEstimator:
+    """
+    Estimate the connection timeout of a single host. Until the first round trip time has been
+    measured, and whenever adaptive mode is off, the timeout is the fixed delay of the scanner.
+    """
+    __slots__ = ('__delay', '__adaptive', '__min_delay', '__max_delay', '__srtt', '__rttvar', '__lock')
+
+    def __init__(self, delay, adaptive=False, min_delay=0.1, max_delay=None):
+        """
+        :param delay: the time in seconds that a TCP socket waits until timeout before any round trip
+        time has been measured
+        :type delay: float
+        :param adaptive: whether the timeout is derived from the measured round trip times
+        :type adaptive: bool
+        :param min_delay: the lower bound of the adaptive timeout in seconds
+        :type min_delay: float
+        :param max_delay: the upper bound of the adaptive timeout in seconds, default to delay
+        :type max_delay: float
+        """
+        self.__delay = delay
+        self.__adaptive = adaptive
+        self.__min_delay = min_delay
+        self.__max_delay = delay if max_delay is None else max_delay
+        self.__srtt = None
+        self.__rttvar = None
+        self.__lock = threading.Lock()
+
+    def timeout(self):
+        """
+        Return the timeout in seconds to be used by the next probe of this host.
+
+        :rtype: float
+        """
+        if not self.__adaptive or self.__srtt is None:
+            return self.__delay
+
+        timeout = self.__srtt + 4 * self.__rttvar
+        return min(self.__max_delay, max(self.__min_delay, timeout))
+
+    def update(self, rtt):
+        """
+        Feed the round trip time of an answered probe, either accepted or refused, into the estimator.
+
+        :param rtt: the round trip time in seconds
+        :type rtt: float
+        """
+        if not self.__adaptive:
+            return
+
+        with self.__lock:
+            if self.__srtt is None:
+                self.__srtt = rtt
+                self.__rttvar = rtt / 2
+            else:
+                delta = rtt - self.__srtt
+                self.__srtt += delta / 8
+                self.__rttvar += (abs(delta) - self.__rttvar) / 4
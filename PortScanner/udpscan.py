@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the UDP prober. Probes are sent from one UDP socket per address family, with a payload the
+service behind well known ports answers to, and a single receive loop on the event loop matches both the UDP
+replies and the ICMP errors the kernel queues on the socket, so no file descriptor is spent per port. ICMP
+errors are read from the error queue of the socket (IP_RECVERR), which needs Linux but no privileges.
+"""
+
+import asyncio
+import errno
+import platform
+import socket
+import struct
+
+from results import PortStatus
+
+# Linux socket options and flags that the socket module does not always define
+IP_RECVERR = getattr(socket, 'IP_RECVERR', 11)
+IPV6_RECVERR = getattr(socket, 'IPV6_RECVERR', 25)
+MSG_ERRQUEUE = getattr(socket, 'MSG_ERRQUEUE', 0x2000)
+
+# origins of the errors read from the error queue, see sock_extended_err in linux/errqueue.h
+SO_EE_ORIGIN_ICMP = 2
+SO_EE_ORIGIN_ICMP6 = 3
+
+# (origin, ICMP type, ICMP code) of a port unreachable error, the only ICMP error meaning the port is CLOSED
+PORT_UNREACHABLE = ((SO_EE_ORIGIN_ICMP, 3, 3), (SO_EE_ORIGIN_ICMP6, 1, 4))
+
+# errors of earlier probes that a send or a receive on the shared socket may report instead of its own result
+ASYNC_ERRORS = (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EACCES, errno.EPROTO)
+
+# receive buffer size of the sockets in bytes, capped by the kernel (net.core.rmem_max on Linux)
+RECEIVE_BUFFER_SIZE = 4 << 20
+
+# payloads that the services behind these ports answer to, other ports get the scanning alert message
+PAYLOADS = {
+    # DNS: standard query for the NS records of the root zone
+    53: b'\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x02\x00\x01',
+    # TFTP: read request of a file named "a"
+    69: b'\x00\x01a\x00octet\x00',
+    # portmapper: RPC NULL call to program 100000 version 2
+    111: struct.pack('!10L', 0x12345678, 0, 2, 100000, 2, 0, 0, 0, 0, 0),
+    # NTP: version 4 client request
+    123: b'\xe3' + b'\x00' * 47,
+    # NetBIOS name service: node status request for "*"
+    137: b'\x80\xf0\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x20' + b'CK' + b'A' * 30 + b'\x00\x00\x21\x00\x01',
+    # SNMP: v1 get-request of sysDescr.0 with the "public" community
+    161: (
+        b'\x30\x29\x02\x01\x00\x04\x06public\xa0\x1c\x02\x04\x12\x34\x56\x78\x02\x01\x00\x02\x01\x00'
+        b'\x30\x0e\x30\x0c\x06\x08\x2b\x06\x01\x02\x01\x01\x01\x00\x05\x00'
+    ),
+    # SSDP: discovery request
+    1900: b'M-SEARCH * HTTP/1.1\r\nHOST: 239.255.255.250:1900\r\nMAN: "ssdp:discover"\r\nMX: 1\r\nST: ssdp:all\r\n\r\n',
+    # mDNS: the same query as DNS
+    5353: b'\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x02\x00\x01',
+    # memcached: stats command behind the UDP frame header
+    11211: b'\x00\x01\x00\x00\x00\x01\x00\x00stats\r\n',
+}
+
+
+def is_supported():
+    """
+    Check whether closed UDP ports can be told apart from filtered ones on this host.
+
+    :return: True on Linux, where ICMP errors are read from the error queue of the socket.
+    :rtype: bool
+    """
+    return platform.system() == 'Linux'
+
+
+class UdpProber:
+    """
+    Send UDP probes from one socket per address family and resolve them from the replies and ICMP errors
+    read on the event loop.
+    A UDP reply means the port is OPEN, an ICMP port unreachable means it is CLOSED, and any other ICMP
+    error means it is FILTERED. No reply before the timeout, even after a retransmission, means the port is
+    FILTERED as well, although it may be an open port whose service ignored the probe.
+    """
+
+    def __init__(self, message=b'', retries=1):
+        """
+        :param message: the payload sent to the ports that have none in PAYLOADS
+        :type message: bytes
+        :param retries: the number of times a probe is sent again within its timeout, since UDP may lose it
+        :type retries: int
+        """
+        self.message = message
+        self.retries = max(0, int(retries))
+        self.__socks = {}
+        self.__loop = None
+        # Outstanding probes keyed by (packed ip, port), several hosts may resolve to the same address
+        self.__pending = {}
+
+    def open(self):
+        """
+        Open the UDP sockets and start the receive loop on the running event loop. IPv6 is only
+        probed if the host supports it.
+        """
+        self.__loop = asyncio.get_running_loop()
+        for family, level, option in (
+            (socket.AF_INET, socket.IPPROTO_IP, IP_RECVERR), (socket.AF_INET6, socket.IPPROTO_IPV6, IPV6_RECVERR)
+        ):
+            try:
+                sock = socket.socket(family, socket.SOCK_DGRAM)
+            except socket.error:
+                if family == socket.AF_INET:
+                    raise
+                continue
+            sock.setblocking(False)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+                if is_supported():
+                    # Queue the ICMP errors of unconnected sends, each with the address it answers.
+                    sock.setsockopt(level, option, 1)
+            except socket.error:
+                pass
+            self.__socks[family] = sock
+            self.__loop.add_reader(sock.fileno(), self.__receive, family)
+
+    def close(self):
+        """
+        Stop the receive loop and close the sockets.
+        """
+        for sock in self.__socks.values():
+            self.__loop.remove_reader(sock.fileno())
+            sock.close()
+        self.__socks = {}
+
+    def __resolve(self, family, address, status, err):
+        """
+        Resolve the probe sent to the given address, if it is outstanding.
+
+        :param family: the address family, socket.AF_INET or socket.AF_INET6
+        :type family: int
+        :param address: the address the probe has been sent to, as returned by recvfrom()
+        :type address: tuple
+        :param status: the status of the port
+        :type status: PortStatus
+        :param err: the errno of the probe, 0 if none
+        :type err: int
+        """
+        try:
+            key = (socket.inet_pton(family, address[0].split('%')[0]), address[1])
+        except (socket.error, TypeError, ValueError, IndexError):
+            return
+        for waiter in self.__pending.get(key, ()):
+            if not waiter.done():
+                waiter.set_result((status, err))
+
+    def __receive(self, family):
+        """
+        Read every pending ICMP error and reply from the socket of the given family and resolve the probes
+        they answer.
+
+        :param family: the address family, socket.AF_INET or socket.AF_INET6
+        :type family: int
+        """
+        sock = self.__socks[family]
+        while True:
+            try:
+                data, ancdata, flags, address = sock.recvmsg(512, 512, MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError):
+                break
+            except (socket.error, AttributeError):
+                break
+
+            for level, kind, extended_err in ancdata:
+                if kind not in (IP_RECVERR, IPV6_RECVERR) or len(extended_err) < 8:
+                    continue
+                # struct sock_extended_err { u32 ee_errno; u8 ee_origin; u8 ee_type; u8 ee_code; ... }
+                err, origin, icmp_type, icmp_code = struct.unpack('=IBBB', extended_err[:7])
+                if origin not in (SO_EE_ORIGIN_ICMP, SO_EE_ORIGIN_ICMP6):
+                    continue
+                if (origin, icmp_type, icmp_code) in PORT_UNREACHABLE:
+                    self.__resolve(family, address, PortStatus.CLOSED, errno.ECONNREFUSED)
+                else:
+                    self.__resolve(family, address, PortStatus.FILTERED, err)
+
+        while True:
+            try:
+                data, address = sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except socket.error as e:
+                if e.errno in ASYNC_ERRORS:
+                    # The pending error of an earlier probe, already read from the error queue.
+                    continue
+                return
+            self.__resolve(family, address, PortStatus.OPEN, 0)
+
+    async def __send(self, sock, payload, ip, port_number):
+        """
+        Send one datagram, waiting for room in the send buffer of the socket.
+        """
+        reported = 0
+        while True:
+            try:
+                sock.sendto(payload, (ip, port_number))
+                return
+            except BlockingIOError:
+                # The send buffer is full, give the receive loop a chance to run.
+                await asyncio.sleep(0.001)
+            except socket.error as e:
+                # A send may report the pending error of an earlier probe, which clears it.
+                reported += 1
+                if e.errno not in ASYNC_ERRORS or reported > len(ASYNC_ERRORS):
+                    raise
+
+    async def probe(self, ip, port_number, timing):
+        """
+        Send one UDP probe, and send it again if nothing came back after an even share of its timeout.
+
+        :param ip: the ip address that is being scanned
+        :type ip: str
+        :param port_number: the port that is going to be checked
+        :type port_number: int
+        :param timing: the timeout estimator of the host, fed with the measured round trip time
+        :type timing: TimeoutEstimator
+        :return: status of the port, the round trip time in seconds of the probe, or None if no reply
+        was received, and the errno of the probe, 0 if none.
+        :rtype: tuple
+        """
+        port_number = int(port_number)
+        family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+        sock = self.__socks.get(family)
+        if sock is None:
+            return PortStatus.FILTERED, None, errno.EAFNOSUPPORT
+
+        key = (socket.inet_pton(family, ip), port_number)
+        waiter = self.__loop.create_future()
+        self.__pending.setdefault(key, []).append(waiter)
+
+        payload = PAYLOADS.get(port_number, self.message)
+        attempts = self.retries + 1
+        delay = timing.timeout() / attempts
+        try:
+            for attempt in range(attempts):
+                start_time = self.__loop.time()
+                await self.__send(sock, payload, ip, port_number)
+                done, pending = await asyncio.wait([waiter], timeout=delay)
+                if done:
+                    break
+            else:
+                return PortStatus.FILTERED, None, errno.ETIMEDOUT
+            status, err = waiter.result()
+
+        except socket.error as e:
+            return PortStatus.FILTERED, None, e.errno or 0
+
+        finally:
+            waiters = self.__pending[key]
+            waiters.remove(waiter)
+            if not waiters:
+                del self.__pending[key]
+
+        rtt = self.__loop.time() - start_time
+        if attempt == 0:
+            # The reply to a retransmitted probe may answer either send, so its time is not measured (Karn).
+            timing.update(rtt)
+        return status, rtt, err
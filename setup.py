@@ -6,4 +6,5 @@ setup(
     description='Port Scanner for Python',
     packages=['PortScanner'],
     include_package_data=True,
+    python_requires='>=3.9',
 )